@@ -1,4 +1,8 @@
+import itertools
 import json
+import math
+import operator
+import os
 import re
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox
@@ -7,6 +11,70 @@ from stack_frame import StackFrame
 from view import AppView
 from vm import VM
 
+_OPCODE_RE = re.compile(r'(\w+)\s*(.*)')
+_OPERAND_SPLIT_RE = re.compile(r'(,"[^"]*"|,\s*)')
+_LONG_NUMBER_RE = re.compile(rb'\d{19}')  # A run of digits that may be an integer beyond 64 bits
+
+_STATE_FIELDS = frozenset({'pc', 'global_memory', 'call_stack', 'heap'})  # Sections of an exported VM state
+_VARIABLE_FIELDS = frozenset({'global_memory', 'call_stack'})  # Sections restored by "Import Variables Only"
+
+_RUN_SLICE = 20000  # Instructions executed per Run slice, between which Tk handles events
+_UI_REFRESH_MS = 33  # Interval of display refreshes while a Run is in progress
+
+_CONFIG_PATH = 'config.json'
+_SYNTAX_GUIDE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '3AC Syntax for interpreter.txt')
+_config_cache = None  # (mtime, config) of the last config file read, reused while the file is unchanged
+
+try:
+    import orjson  # Much faster than the stdlib for large VM state files
+except ImportError:
+    orjson = None
+
+
+def _has_non_finite(value):
+    """Returns whether a VM state value holds an inf or nan float, which orjson would write as null."""
+    if type(value) is float:
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return False
+    return any(map(_has_non_finite, value))
+
+
+def _dump_state(vm_state, f):
+    """Serializes a VM state dictionary to a binary file object."""
+    if orjson is not None and not _has_non_finite(vm_state):
+        try:
+            f.write(orjson.dumps(vm_state, default=repr,
+                                 option=orjson.OPT_INDENT_2))
+            return
+        except orjson.JSONEncodeError:
+            pass  # e.g. an int beyond 64 bits, which only the stdlib can write
+    f.write(json.dumps(vm_state, indent=2, default=repr).encode('utf-8'))
+
+
+def _load_state(f):
+    """Deserializes a VM state dictionary from a binary file object."""
+    data = f.read()
+    # orjson reads integers beyond 64 bits as floats, so leave files that may hold one to the stdlib
+    if orjson is not None and not _LONG_NUMBER_RE.search(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN or Infinity, which only the stdlib reads
+    return json.loads(data)
+
+
+def _read_config():
+    """Reads the UI configuration file, reusing the previous parse if the file has not changed."""
+    global _config_cache
+    mtime = os.stat(_CONFIG_PATH).st_mtime
+    if _config_cache is None or _config_cache[0] != mtime:
+        with open(_CONFIG_PATH, 'r') as f:
+            _config_cache = (mtime, json.load(f))
+    return _config_cache[1]
+
 
 class AppController:
     """The Controller class, handling all application logic and state."""
@@ -22,18 +90,29 @@ class AppController:
         self.vm.console_output = self.view.console_text
 
         self.current_3ac_lines = []
+        self._highlight_cache = []  # Per-line [(text, tag), ...] segments for the code display
+        self._last_highlighted_line = None  # Source line currently tagged as "current_line"
         self.breakpoints = set()
+        self._bp_mask = bytearray()  # Indexed by PC, non-zero where the instruction's line has a breakpoint
+        self._line_to_pcs = {}  # Source line number -> PCs of the instructions on that line
         self.watch_window = None
         self.watched_variables = []
+        self._last_watch_lines = None  # Lines currently shown in the watch listbox
+        self._run_job = None  # Pending after() id of the next Run slice
+        self._ui_job = None  # Pending after() id of the next display refresh during a Run
         
         # --- Search state ---
         self.search_window = None
         self.search_entry = None
 
+        self._syntax_guide_cached = None  # Contents of the syntax guide, read on first use
+
         # Bind keyboard shortcuts
         self.master.bind_all("<F5>", self.run_execution)
         self.master.bind_all("<F10>", self.step_execution)
 
+        self.show_bp_popup = True  # Show a dialog when a breakpoint is hit or execution ends
+        self._config_snapshot = None  # The configuration as last loaded or saved
         self._load_config()
 
     def update_status_bar(self, event=None):
@@ -49,6 +128,7 @@ class AppController:
 
     def exit_app(self):
         """Closes the application."""
+        self._cancel_run()
         self._save_config()
         self.master.quit()
 
@@ -58,18 +138,23 @@ class AppController:
             config = {
                 'main_pane_sash_pos': self.view.main_pane.sash_coord(0)[0],
                 'right_pane_sash_pos': [self.view.right_pane.sash_coord(i)[1] for i in
-                                        range(len(self.view.right_pane.panes()) - 1)]
+                                        range(len(self.view.right_pane.panes()) - 1)],
+                'bp_popup': self.show_bp_popup
             }
-            with open('config.json', 'w') as f:
+            if config == self._config_snapshot:
+                return  # Nothing changed, so skip the write
+            with open(_CONFIG_PATH, 'w') as f:
                 json.dump(config, f)
+            self._config_snapshot = config
         except Exception as e:
             print(f"Could not save config: {e}") # Log to console, but don't block exit
 
     def _load_config(self):
         """Loads UI configuration from a file and applies it."""
         try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
+            config = _read_config()
+            self._config_snapshot = config
+            self.show_bp_popup = config.get('bp_popup', True)
 
             # We need to wait until the window is drawn to apply sash positions
             def apply_sash_positions():
@@ -98,21 +183,25 @@ class AppController:
         if not filepath:
             return
 
+        self._cancel_run()
         try:
             with open(filepath, 'r') as f:
                 self.current_3ac_lines = f.readlines()
 
             self.vm.load_program(self.current_3ac_lines)
+            self._build_highlight_cache()
             self.breakpoints.clear()
+            self._index_program()
             self.watched_variables.clear()
-            self._update_code_display()
+            self._render_code_display()
             self.update_displays()
             messagebox.showinfo("Load 3AC", f"Successfully loaded {filepath}")
         except Exception as e:
             messagebox.showerror("Error Loading File", f"Could not load 3AC file: {e}")
             self.current_3ac_lines = []
+            self._build_highlight_cache()
             self.vm.reset_state()
-            self._update_code_display()  # Clear code display on error
+            self._render_code_display()  # Clear code display on error
             self.update_displays()
 
     def show_about(self):
@@ -156,7 +245,10 @@ class AppController:
 """
         help_text_widget.insert(tk.END, usage_guide)
         help_text_widget.insert(tk.END, syntax_guide)
-        help_text_widget.insert(tk.END, open('c:\\Users\\adnan\\OneDrive - University of Tripoli\\قسم الحاسب الآلي\\المواد\\CS432\\My3ACInterpreter\\3ACInterpreter\\3AC Syntax for interpreter.txt').read())
+        if self._syntax_guide_cached is None:
+            with open(_SYNTAX_GUIDE_PATH, 'r', encoding='utf-8') as f:
+                self._syntax_guide_cached = f.read()
+        help_text_widget.insert(tk.END, self._syntax_guide_cached)
         help_text_widget.config(state=tk.DISABLED)  # Make it read-only
 
     def export_vm_state(self):
@@ -181,28 +273,38 @@ class AppController:
                     "func_name": frame.func_name,
                     "return_address": frame.return_address,
                     "return_var_name": frame.return_var_name,
-                    "locals": frame.locals,
-                    "params": frame.params
+                    "locals": self.vm.named_variables(frame.locals),
+                    "params": self.vm.named_params(frame)
                 })
 
-            # Create a dictionary of only the active heap slots
-            active_heap = {i: v for i, v in enumerate(self.vm.heap) if v is not None}
+            # Store only the active heap slots, as [address, value] pairs
+            active_heap = [[i, v] for i, v in enumerate(self.vm.heap) if v is not None]
 
             vm_state = {
                 "pc": self.vm.pc,
-                "global_memory": self.vm.global_memory,
+                "global_memory": self.vm.named_variables(self.vm.global_memory),
                 "call_stack": serializable_stack,
-                "heap": active_heap
+                "heap": active_heap,
+                "heap_size": len(self.vm.heap),
+                "heap_top": self.vm.heap_top,
+                "free_heap_slots": self.vm.free_heap_slots
             }
 
-            with open(filepath, 'w') as f:
-                json.dump(vm_state, f, indent=4)
+            with open(filepath, 'wb') as f:
+                _dump_state(vm_state, f)
             messagebox.showinfo("Export Successful", f"VM state successfully exported to {filepath}")
         except Exception as e:
             messagebox.showerror("Export Error", f"Failed to export VM state: {e}")
 
-    def import_vm_state(self):
-        """Imports a previously exported VM state from a JSON file."""
+    def import_vm_variables(self):
+        """Imports only the global variables and the call stack from an exported VM state file."""
+        self.import_vm_state(_VARIABLE_FIELDS)
+
+    def import_vm_state(self, fields=_STATE_FIELDS):
+        """
+        Imports a previously exported VM state from a JSON file.
+        Only the sections named in fields ('pc', 'global_memory', 'call_stack', 'heap') are restored.
+        """
         if not self.current_3ac_lines:
             messagebox.showwarning("Import State", "A 3AC program must be loaded before importing a state.")
             return
@@ -214,37 +316,47 @@ class AppController:
         if not filepath:
             return
 
+        self._cancel_run()
         try:
-            with open(filepath, 'r') as f:
-                vm_state = json.load(f)
+            with open(filepath, 'rb') as f:
+                vm_state = _load_state(f)
+            self._restore_vm_state(vm_state, fields)
+            self.update_displays()
+            messagebox.showinfo("Import Successful", f"VM state successfully imported from {filepath}")
+        except Exception as e:
+            messagebox.showerror("Import Error", f"Failed to import VM state: {e}")
 
-            # --- Restore VM State ---
+    def _restore_vm_state(self, vm_state, fields):
+        """Restores the sections of a loaded VM state dictionary that are named in fields, leaving the rest alone."""
+        if 'pc' in fields:
             self.vm.pc = vm_state['pc']
-            self.vm.global_memory = vm_state['global_memory']
+        if 'global_memory' in fields:
+            self.vm.global_memory = self.vm.slots_from(vm_state['global_memory'])
 
+        if 'call_stack' in fields:
             # Reconstruct the call stack from serialized data
             self.vm.call_stack = []
             for frame_data in vm_state['call_stack']:
                 frame = StackFrame(frame_data['func_name'], frame_data['return_address'], frame_data['return_var_name'])
-                frame.locals = frame_data['locals']
-                frame.params = frame_data['params']
+                frame.locals = self.vm.slots_from(frame_data['locals'])
+                frame.params = list(frame_data['params'].values())
                 self.vm.call_stack.append(frame)
 
-            # Reconstruct the heap
-            self.vm.heap = [None] * len(self.vm.heap) # Reset heap to its default size
-            active_heap_from_file = vm_state['heap']
-            for addr_str, value in active_heap_from_file.items():
-                addr = int(addr_str)
-                if 0 <= addr < len(self.vm.heap):
-                    self.vm.heap[addr] = value
-            
-            # Reconstruct the free list
-            self.vm.free_heap_slots = [i for i, v in enumerate(self.vm.heap) if v is None]
-
-            self.update_displays()
-            messagebox.showinfo("Import Successful", f"VM state successfully imported from {filepath}")
-        except Exception as e:
-            messagebox.showerror("Import Error", f"Failed to import VM state: {e}")
+        if 'heap' in fields:
+            # Reconstruct the heap. This is the largest section, so skipping it saves the most work.
+            heap = [None] * vm_state['heap_size']
+            for addr, value in vm_state['heap']:
+                heap[addr] = value
+            self.vm.heap = heap
+            # States saved without heap_top list every free slot in free_heap_slots
+            self.vm.heap_top = vm_state.get('heap_top', len(heap))
+            self.vm.free_heap_slots = vm_state['free_heap_slots']
+            heap_alive = bytearray(b'\x01') * self.vm.heap_top + bytearray(len(heap) - self.vm.heap_top)
+            for addr in self.vm.free_heap_slots:
+                heap_alive[addr] = 0
+            self.vm.heap_alive = heap_alive
+        self.vm._pad_storage()  # Sections restored earlier may predate variables added by later ones
+        self.vm._mark_all_dirty()
 
     def show_search_dialog(self):
         """Creates and shows the search dialog window."""
@@ -348,6 +460,7 @@ class AppController:
         remove_button = tk.Button(self.watch_window, text="Remove Selected Variable", command=self.remove_watch_variable)
         remove_button.pack(side=tk.BOTTOM, pady=5)
         
+        self._last_watch_lines = None  # The listbox is new, so it must be populated
         self.update_watch_display() # Initial population
 
     def add_watch_variable(self, event=None):
@@ -374,171 +487,219 @@ class AppController:
 
     def toggle_breakpoint(self, event):
         """Toggles a breakpoint on the clicked line."""
-        # The text widget is disabled, so we need to enable it briefly to manage tags
-        self.view.code_display.config(state=tk.NORMAL)
-
         # Get the line number from the click position
         index = self.view.code_display.index(f"@{event.x},{event.y}")
         line_num = int(index.split('.')[0]) - 1  # Convert to 0-based index
+        self._set_bp(line_num, line_num not in self.breakpoints)
+        self.update_status_bar(event) # Update status bar after click
 
-        if line_num in self.breakpoints:
-            self.breakpoints.remove(line_num)
-            self.view.code_display.tag_remove("breakpoint", f"{line_num + 1}.0", f"{line_num + 1}.end")
-        else:
+    def _set_bp(self, line_num, on):
+        """Sets or clears the breakpoint on a source line, updating its tag and the PC mask."""
+        if on:
             self.breakpoints.add(line_num)
             self.view.code_display.tag_add("breakpoint", f"{line_num + 1}.0", f"{line_num + 1}.end")
-
-        self.view.code_display.config(state=tk.DISABLED)
-        self.update_status_bar(event) # Update status bar after click
-
-    def _update_code_display(self):
+        else:
+            self.breakpoints.discard(line_num)
+            self.view.code_display.tag_remove("breakpoint", f"{line_num + 1}.0", f"{line_num + 1}.end")
+        for pc in self._line_to_pcs.get(line_num, ()):
+            self._bp_mask[pc] = on
+
+    def _index_program(self):
+        """Maps source lines to PCs for the loaded program and rebuilds the breakpoint mask."""
+        self._line_to_pcs = {}
+        for pc, instr in enumerate(self.vm.program):
+            self._line_to_pcs.setdefault(instr.line_num, []).append(pc)
+        self._bp_mask = bytearray(len(self.vm.program))
+        for line_num in self.breakpoints:
+            for pc in self._line_to_pcs.get(line_num, ()):
+                self._bp_mask[pc] = 1
+
+    def _render_code_display(self):
+        """Redraws the whole source panel. Only needed when the program or breakpoints are reset."""
         self.view.code_display.config(state=tk.NORMAL)
         self.view.code_display.delete('1.0', tk.END)
 
-        # Display line numbers and highlighted code
-        for i, line in enumerate(self.current_3ac_lines):
-            line_num_str = f"{i:4d}: "
-            line_start_index = f"{i + 1}.0"
-            self.view.code_display.insert(tk.END, line_num_str)
-            self._highlight_syntax(line.strip(), line_start_index, len(line_num_str))
-            self.view.code_display.insert(tk.END, "\n")
+        # Display line numbers and highlighted code from the pre-computed segments.
+        # The text goes in with one insert; each tag is then applied to all of its ranges at once.
+        lines = []
+        tag_ranges = {}  # tag -> [start, end, start, end, ...] text indices
+        for i, segments in enumerate(self._highlight_cache):
+            prefix = f"{i:4d}: "
+            col = len(prefix)  # Wider than 6 from line 10000 on
+            for text, tag in segments:
+                if tag and text:
+                    tag_ranges.setdefault(tag, []).extend((f"{i + 1}.{col}", f"{i + 1}.{col + len(text)}"))
+                col += len(text)
+            lines.append(prefix + "".join(text for text, _ in segments) + "\n")
+        self.view.code_display.insert(tk.END, "".join(lines))
+        for tag, ranges in tag_ranges.items():
+            self.view.code_display.tag_add(tag, *ranges)
 
         # Re-apply breakpoint tags
         for bp_line in self.breakpoints:
             self.view.code_display.tag_add("breakpoint", f"{bp_line + 1}.0", f"{bp_line + 1}.end")
 
-        # Remove current line highlight before re-applying
-        self.view.code_display.tag_remove("current_line", "1.0", tk.END)
+        self.view.code_display.config(state=tk.DISABLED)
+
+        # The old text (and its tags) is gone, so the marker has to be re-applied
+        self._last_highlighted_line = None
+        self._update_current_line_marker()
 
-        # Highlight current instruction if running
+    def _update_current_line_marker(self):
+        """Moves the "current_line" tag to the instruction at the VM's program counter."""
+        new_line = None
         if self.vm.running and not self.vm.halted and 0 <= self.vm.pc < len(self.vm.program):
             # Find the actual line number in the original file for the current instruction
-            original_line_num = self.vm.program[self.vm.pc].line_num
-            start_index = f"{original_line_num + 1}.0"
-            end_index = f"{original_line_num + 1}.end"
-            self.view.code_display.tag_add("current_line", start_index, end_index)
+            new_line = self.vm.program[self.vm.pc].line_num
+
+        if new_line == self._last_highlighted_line:
+            return
+
+        self.view.code_display.tag_remove("current_line", "1.0", tk.END)
+        if new_line is not None:
+            start_index = f"{new_line + 1}.0"
+            self.view.code_display.tag_add("current_line", start_index, f"{new_line + 1}.end")
             self.view.code_display.see(start_index)  # Scroll to the current line
+        self._last_highlighted_line = new_line
 
-        self.view.code_display.config(state=tk.DISABLED)
+    def _build_highlight_cache(self):
+        """Computes the syntax highlighting segments for every loaded line once."""
+        self._highlight_cache = [self._highlight_syntax(line.strip()) for line in self.current_3ac_lines]
 
-    def _highlight_syntax(self, line, line_start_index, content_start_offset):
-        """Applies syntax highlighting tags to a single line of code."""
+    def _highlight_syntax(self, line):
+        """Splits a single line of code into (text, tag) segments for syntax highlighting."""
         if not line or line.startswith('#'):
-            start = f"{line_start_index}+{content_start_offset}c"
-            self.view.code_display.insert(start, line)
-            self.view.code_display.tag_add("comment", start, f"{start}+{len(line)}c")
-            return
+            return [(line, "comment")]
 
         if line.endswith(':'):
-            start = f"{line_start_index}+{content_start_offset}c"
-            self.view.code_display.insert(start, line)
-            self.view.code_display.tag_add("label", start, f"{start}+{len(line)}c")
-            return
+            return [(line, "label")]
 
-        match = re.match(r'(\w+)\s*(.*)', line)
+        match = _OPCODE_RE.match(line)
         if not match:
-            start = f"{line_start_index}+{content_start_offset}c"
-            self.view.code_display.insert(start, line) # Insert plain if no match
-            return
+            return [(line, ())] # Plain text if no match
 
         opcode, operands_str = match.groups()
-        
-        # Insert and highlight opcode
-        opcode_start = f"{line_start_index}+{content_start_offset}c"
-        self.view.code_display.insert(opcode_start, opcode)
-        self.view.code_display.tag_add("opcode", opcode_start, f"{opcode_start}+{len(opcode)}c")
+        segments = [(opcode, "opcode")]
 
-        # Insert and highlight operands
-        current_pos = len(opcode)
         # Use a more robust regex for splitting operands, handling strings with commas
-        operands_and_delimiters = re.split(r'(,"[^"]*"|,\s*)', " " + operands_str)
-        
+        operands_and_delimiters = _OPERAND_SPLIT_RE.split(" " + operands_str)
+
         for part in operands_and_delimiters:
             if not part: continue
-            part_start_index = f"{opcode_start}+{current_pos}c"
-            self.view.code_display.insert(part_start_index, part)
-            
             # Check if the part (trimmed) is a literal
-            if self.vm._parse_operand_value(part.strip().strip(',')) != part.strip().strip(','):
-                self.view.code_display.tag_add("literal", part_start_index, f"{part_start_index}+{len(part)}c")
-            current_pos += len(part)
+            cleaned = part.strip().strip(',')
+            if self.vm._parse_operand_value(cleaned) != cleaned:
+                segments.append((part, "literal"))
+            else:
+                segments.append((part, ()))
+        return segments
 
     def update_displays(self):
-        self._update_code_display()
+        self._update_current_line_marker()
         self.update_watch_display()
 
-        # Update Memory Display
-        self.view.mem_display.config(state=tk.NORMAL)
-        self.view.mem_display.delete('1.0', tk.END)
-        self.view.mem_display.insert(tk.END, "--- Global Memory ---\n")
-        if not self.vm.global_memory:
-            self.view.mem_display.insert(tk.END, "(empty)\n")
+        # Only redraw the memory regions the VM has written to since the last update
+        vm = self.vm
+        if vm._globals_dirty or vm._locals_dirty or vm._stack_dirty:
+            self._update_memory_display()
+        if vm._heap_dirty:
+            self._update_heap_display()
+        if vm._stack_dirty:
+            self._update_stack_display()
+        vm._globals_dirty = vm._locals_dirty = vm._heap_dirty = vm._stack_dirty = False
+
+    def _update_memory_display(self):
+        # Build the whole text first so the widget is updated with a single insert
+        parts = ["--- Global Memory ---\n"]
+        global_vars = self.vm.named_variables(self.vm.global_memory)
+        if not global_vars:
+            parts.append("(empty)\n")
         else:
-            for k, v in self.vm.global_memory.items():
-                self.view.mem_display.insert(tk.END, f"{k} = {repr(v)}\n")
+            parts.extend(f"{k} = {v!r}\n" for k, v in global_vars.items())
 
         if self.vm.call_stack:
             current_frame = self.vm.call_stack[-1]
-            self.view.mem_display.insert(tk.END, "\n--- Current Stack Frame (Locals) ---\n")
-            if not current_frame.locals and not current_frame.params:
-                self.view.mem_display.insert(tk.END, "(empty)\n")
+            local_vars = self.vm.named_variables(current_frame.locals)
+            params = self.vm.named_params(current_frame)
+            parts.append("\n--- Current Stack Frame (Locals) ---\n")
+            if not local_vars and not params:
+                parts.append("(empty)\n")
             else:
-                if current_frame.params:
-                    self.view.mem_display.insert(tk.END, "Parameters:\n")
-                    for k, v in current_frame.params.items():
-                        self.view.mem_display.insert(tk.END, f"  {k} = {repr(v)}\n")
-                if current_frame.locals:
-                    self.view.mem_display.insert(tk.END, "Local Variables:\n")
-                    for k, v in current_frame.locals.items():
-                        self.view.mem_display.insert(tk.END, f"  {k} = {repr(v)}\n")
-        self.view.mem_display.config(state=tk.DISABLED)
-
-        # Update Heap Display
-        self.view.heap_display.config(state=tk.NORMAL)
-        self.view.heap_display.delete('1.0', tk.END)
-        self.view.heap_display.insert(tk.END, "--- Heap Memory (Address: Value) ---\n")
-        active_heap_slots = {i: v for i, v in enumerate(self.vm.heap) if
-                             v is not None or i not in self.vm.free_heap_slots}
-        if not active_heap_slots:
-            self.view.heap_display.insert(tk.END, "(empty / all free)\n")
+                if params:
+                    parts.append("Parameters:\n")
+                    parts.extend(f"  {k} = {v!r}\n" for k, v in params.items())
+                if local_vars:
+                    parts.append("Local Variables:\n")
+                    parts.extend(f"  {k} = {v!r}\n" for k, v in local_vars.items())
+        self._replace_text(self.view.mem_display, "".join(parts))
+
+    def _update_heap_display(self):
+        parts = ["--- Heap Memory (Address: Value) ---\n"]
+        heap = self.vm.heap
+        heap_alive = self.vm.heap_alive
+        # Allocated cells, plus any value stored through a pointer into a cell ALLOC_HEAP never handed out
+        in_use = map(operator.or_, heap_alive, map(operator.is_not, heap, itertools.repeat(None)))
+        shown_addresses = list(itertools.compress(range(len(heap)), in_use))
+        if not shown_addresses:
+            parts.append("(empty / all free)\n")
         else:
-            for addr in sorted(active_heap_slots.keys()):
-                val = self.vm.heap[addr]
-                self.view.heap_display.insert(tk.END, f"[{addr:04d}]: {repr(val)}\n")
-        self.view.heap_display.config(state=tk.DISABLED)
-
-        # Update Stack Display
-        self.view.stack_display.config(state=tk.NORMAL)
-        self.view.stack_display.delete('1.0', tk.END)
-        self.view.stack_display.insert(tk.END, "--- Call Stack (Top -> Bottom) ---\n")
+            parts.extend(f"[{addr:04d}]: {heap[addr]!r}{'' if heap_alive[addr] else '  (unallocated)'}\n"
+                         for addr in shown_addresses)
+        self._replace_text(self.view.heap_display, "".join(parts))
+
+    def _update_stack_display(self):
+        parts = ["--- Call Stack (Top -> Bottom) ---\n"]
         if not self.vm.call_stack:
-            self.view.stack_display.insert(tk.END, "(empty)\n")
+            parts.append("(empty)\n")
         else:
-            for i, frame in enumerate(reversed(self.vm.call_stack)):  # Display top of stack first
-                self.view.stack_display.insert(tk.END,
-                                          f"[{len(self.vm.call_stack) - 1 - i}] {frame.func_name} (ret_PC: {frame.return_address})\n")
-        self.view.stack_display.config(state=tk.DISABLED)
+            depth = len(self.vm.call_stack)
+            parts.extend(f"[{depth - 1 - i}] {frame.func_name} (ret_PC: {frame.return_address})\n"
+                         for i, frame in enumerate(reversed(self.vm.call_stack)))  # Display top of stack first
+        self._replace_text(self.view.stack_display, "".join(parts))
+
+    def _replace_text(self, widget, text):
+        """Replaces the contents of a read-only text widget."""
+        widget.config(state=tk.NORMAL)
+        widget.delete('1.0', tk.END)
+        widget.insert(tk.END, text)
+        widget.config(state=tk.DISABLED)
 
     def update_watch_display(self):
-        """Updates the content of the watch window."""
+        """Updates the content of the watch window, rewriting only the entries that changed."""
         if not self.watch_window or not self.watch_window.winfo_exists() or not hasattr(self.view, 'watch_display'):
             return
 
-        self.view.watch_display.delete(0, tk.END) # Clear the listbox
-
         if not self.watched_variables:
-            self.view.watch_display.insert(tk.END, "(No variables to watch)")
+            new_lines = ["(No variables to watch)"]
         else:
-            for var_name in self.watched_variables:
-                value = self.vm._get_operand_value(var_name)
-                self.view.watch_display.insert(tk.END, f"{var_name} = {repr(value)}")
+            new_lines = [f"{var_name} = {repr(self.vm._get_operand_value(var_name))}"
+                         for var_name in self.watched_variables]
+
+        old_lines = self._last_watch_lines
+        if old_lines is None or len(old_lines) != len(new_lines):
+            # A variable was added or removed (or the listbox is new), so resync everything
+            self.view.watch_display.delete(0, tk.END)
+            self.view.watch_display.insert(tk.END, *new_lines)
+        else:
+            for i, (old, new) in enumerate(zip(old_lines, new_lines)):
+                if old != new:
+                    self.view.watch_display.delete(i)
+                    self.view.watch_display.insert(i, new)
+        self._last_watch_lines = new_lines
+
+    def _notify(self, title, message):
+        """Reports an execution event in the status bar, and in a dialog if popups are enabled."""
+        self.view.status_bar.config(text=message)
+        if self.show_bp_popup:
+            messagebox.showinfo(title, message)
 
     def step_execution(self, event=None):
+        self._cancel_run()  # Stepping pauses a Run in progress
         if self.vm.running:
             try:
                 stepped = self.vm.step()
                 if not stepped:  # Program halted or finished
-                    messagebox.showinfo("Execution Complete", "Program execution finished or halted.")
+                    self._notify("Execution Complete", "Program execution finished or halted.")
                 self.update_displays()
             except Exception as e:
                 # Error is already logged to console by VM, and message box shown.
@@ -551,40 +712,72 @@ class AppController:
         if not self.vm.running:
             messagebox.showwarning("Execution Status", "Program is not running. Please load a file or reset.")
             return
-
+        if self._run_job is not None:
+            return  # Already running
+        self._run_slice()
+
+    def _run_slice(self):
+        """
+        Executes one slice of a Run, then schedules the next one so the window stays responsive.
+        While running, the displays are refreshed on a timer instead of after every slice.
+        """
+        self._run_job = None
         try:
-            # Loop until the program stops for a reason (halt, error, breakpoint)
-            while self.vm.running:
-                # Check for breakpoint BEFORE executing the instruction
-                current_instr = self.vm.program[self.vm.pc]
-                if current_instr.line_num in self.breakpoints:
-                    messagebox.showinfo("Breakpoint Hit", f"Execution paused at line {current_instr.line_num + 1}.")
-                    self.update_displays()
-                    return  # Stop running but keep the program active
+            # Run until the program stops for a reason (halt, error, breakpoint)
+            if 1 not in self._bp_mask:
+                self.vm.run_until_halt(_RUN_SLICE)  # No breakpoints to check, so use the faster loop
+                hit_breakpoint = False
+            else:
+                hit_breakpoint = self.vm.run_until(self._bp_mask, _RUN_SLICE)
 
-                stepped = self.vm.step()
-                if not stepped:  # Program halted or finished naturally
-                    messagebox.showinfo("Execution Complete", "Program execution finished or halted.")
-                    break  # Exit the while loop
+            if self.vm.running and not hit_breakpoint:  # Out of steps for this slice
+                self._run_job = self.master.after(0, self._run_slice)
+                if self._ui_job is None:
+                    self._ui_job = self.master.after(_UI_REFRESH_MS, self._drain_ui)
+                return
+
+            if hit_breakpoint:
+                line_num = self.vm.program[self.vm.pc].line_num
+                self._notify("Breakpoint Hit", f"Execution paused at line {line_num + 1}.")
+            else:  # Program halted or finished naturally
+                self._notify("Execution Complete", "Program execution finished or halted.")
 
             self.update_displays()  # Final update
         except Exception as e:
             # This will catch any unexpected errors during the run loop
             self.update_displays()
 
+    def _drain_ui(self):
+        """Timer callback that refreshes the displays while a Run is in progress."""
+        self._ui_job = None
+        self.update_displays()
+
+    def _cancel_run(self):
+        """Stops a Run in progress, leaving the VM paused at its current instruction."""
+        if self._run_job is not None:
+            self.master.after_cancel(self._run_job)
+            self._run_job = None
+        if self._ui_job is not None:
+            self.master.after_cancel(self._ui_job)
+            self._ui_job = None
+
     def reset_execution(self):
+        self._cancel_run()
         if self.current_3ac_lines:
             try:
                 self.breakpoints.clear()
                 self.watched_variables.clear()
                 self.vm.load_program(self.current_3ac_lines)
+                self._index_program()
+                self._render_code_display()
                 self.update_displays()
                 messagebox.showinfo("Reset", "Program reset to beginning.")
             except Exception as e:
                 messagebox.showerror("Reset Error", f"Error resetting program: {e}")
                 self.current_3ac_lines = []  # Clear program on load error during reset
+                self._build_highlight_cache()
                 self.vm.reset_state()
-                self._update_code_display()
+                self._render_code_display()
                 self.update_displays()
         else:
             messagebox.showinfo("Reset", "No program loaded to reset.")
@@ -0,0 +1,11 @@
+class FuncInfo:
+    """Load-time description of a function that the program calls."""
+    __slots__ = ('name', 'entry_pc', 'compiled')
+
+    def __init__(self, name, entry_pc):
+        self.name = name
+        self.entry_pc = entry_pc  # PC of the function's first instruction
+        self.compiled = {}  # Parameter count -> compiled Python function, or None if the body can't be compiled
+
+    def __repr__(self):
+        return f"FuncInfo(name='{self.name}', entry_pc={self.entry_pc})"
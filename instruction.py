@@ -1,10 +1,64 @@
+import enum
+import sys
+
+
+class Op(enum.IntEnum):
+    """Opcode numbers. Instruction.op holds one, so opcode checks compare small ints rather than strings."""
+    ASSIGN = enum.auto()
+    CONST_ASSIGN = enum.auto()
+    ADD = enum.auto()
+    SUB = enum.auto()
+    MUL = enum.auto()
+    DIV = enum.auto()
+    MOD = enum.auto()
+    EQ = enum.auto()
+    NE = enum.auto()
+    LT = enum.auto()
+    LE = enum.auto()
+    GT = enum.auto()
+    GE = enum.auto()
+    OR = enum.auto()
+    AND = enum.auto()
+    CONCAT = enum.auto()
+    STRLEN = enum.auto()
+    GETCHAR = enum.auto()
+    JUMP = enum.auto()
+    JUMPT = enum.auto()
+    JUMPF = enum.auto()
+    PARAM = enum.auto()
+    REF_PARAM = enum.auto()
+    CALL = enum.auto()
+    RETURN = enum.auto()
+    PRINT = enum.auto()
+    HALT = enum.auto()
+    UMINUS = enum.auto()
+    ALLOC_HEAP = enum.auto()
+    FREE_HEAP = enum.auto()
+    ADDR_OF = enum.auto()
+    DEREF_LOAD = enum.auto()
+    DEREF_STORE = enum.auto()
+    INDEX_LOAD = enum.auto()
+    INDEX_STORE = enum.auto()
+
+
 class Instruction:
     """Represents a single 3-Address Code instruction."""
+    __slots__ = ('opcode', 'op', 'operands', 'kinds', 'args', 'line_num',
+                 'handler', 'fast_handler', 'return_address', 'debug_label')
 
     def __init__(self, opcode, *operands, line_num=None):
-        self.opcode = opcode
-        self.operands = list(operands)
+        # Opcodes and variable names repeat throughout a program, so intern them to share
+        # one string object each and speed up the dictionary lookups keyed by them.
+        self.opcode = sys.intern(opcode)
+        self.op = Op.__members__.get(self.opcode)  # None for an opcode the VM doesn't support
+        self.operands = tuple(sys.intern(op) if isinstance(op, str) else op for op in operands)
+        self.kinds = ()  # Per-operand kind (literal, variable, label, ...), decoded by VM.load_program
+        self.args = self.operands  # Operands with variable names replaced by slot indices, set by VM.load_program
         self.line_num = line_num
+        self.handler = None  # VM method that executes this instruction, bound by VM.load_program
+        self.fast_handler = None  # Handler used by VM.run_until_halt; may be a superinstruction
+        self.return_address = None  # For CALL: the PC after this instruction, set by VM.load_program
+        self.debug_label = None  # For jumps and CALL: the target label's name, kept for display
 
     def __repr__(self):
         return f"Instruction({self.opcode}, {self.operands}, line={self.line_num})"
\ No newline at end of file
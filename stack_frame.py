@@ -1,12 +1,13 @@
 class StackFrame:
     """Represents an activation record for a function call."""
+    __slots__ = ('func_name', 'return_address', 'return_var_name', 'locals', 'params')
 
     def __init__(self, func_name, return_address, return_var_name=None):
         self.func_name = func_name
         self.return_address = return_address  # PC to return to
         self.return_var_name = return_var_name  # Variable to store return value in caller's frame
-        self.locals = {}  # Local variables
-        self.params = {}  # Parameters (can be values or addresses for pass-by-reference)
+        self.locals = []  # Local variables, indexed by the VM's variable slots
+        self.params = []  # Parameters ARG0, ARG1, ... (can be values or addresses for pass-by-reference)
 
     def __repr__(self):
         return (f"Frame(func='{self.func_name}', ret_addr={self.return_address}, "
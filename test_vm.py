@@ -1,9 +1,13 @@
+import functools
+import io
+import math
 import unittest
 from unittest.mock import patch
 
-from instruction import Instruction
+from controller import AppController, _dump_state, _load_state, orjson
+from instruction import Instruction, Op
 from stack_frame import StackFrame
-from vm import VM
+from vm import VM, _OPERAND_COUNTS
 
 
 class DummyConsoleOutput:
@@ -41,13 +45,23 @@ class TestVM(unittest.TestCase):
         """Stop the patcher after each test."""
         self.messagebox_patcher.stop()
 
+    def test_slots(self):
+        """Tests that Instruction and StackFrame keep every attribute in __slots__."""
+        instr = Instruction('ADD', 't', 'a', 1, line_num=0)
+        frame = StackFrame('f', 3, 'r')
+        self.assertFalse(hasattr(instr, '__dict__'))
+        self.assertFalse(hasattr(frame, '__dict__'))
+        self.vm.load_program(["CALL f, 0, r", "f:", "JUMPT f, c"])
+        self.assertFalse(any(hasattr(instr, '__dict__') for instr in self.vm.program))
+
     def test_load_program_simple(self):
         """Tests loading a basic program with an assignment."""
         code = ["ASSIGN x, 10", "HALT"]
         self.vm.load_program(code)
         self.assertEqual(len(self.vm.program), 2)
         self.assertEqual(self.vm.program[0].opcode, 'ASSIGN')
-        self.assertEqual(self.vm.program[0].operands, ['x', 10])
+        self.assertIs(self.vm.program[0].op, Op.ASSIGN)
+        self.assertEqual(self.vm.program[0].operands, ('x', 10))
         self.assertEqual(self.vm.program[1].opcode, 'HALT')
 
     def test_load_program_with_labels(self):
@@ -73,14 +87,134 @@ class TestVM(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, "Undefined label 'non_existent_label'"):
             self.vm.load_program(code)
 
+    def test_load_program_call_label(self):
+        """Tests that CALL targets are resolved when the program is loaded."""
+        self.vm.load_program(["CALL f, 0, r", "HALT", "f:", "RETURN 1"])
+        call = self.vm.program[0]
+        self.assertEqual(call.args[0].entry_pc, 2)
+        self.assertIs(call.args[0], self.vm.functions['f'])
+        self.assertEqual(call.debug_label, 'f')
+
+        with self.assertRaisesRegex(ValueError, "Undefined label 'g'"):
+            self.vm.load_program(["CALL g, 0, r"])
+
+    def test_load_program_unknown_opcode(self):
+        """Tests that unknown opcodes are rejected when the program is loaded."""
+        code = ["ASSIGN x, 1", "FROB x"]
+        with self.assertRaisesRegex(ValueError, "Unknown or unsupported opcode 'FROB'"):
+            self.vm.load_program(code)
+
+    def test_load_program_line_numbers(self):
+        """Tests that line numbers count blank and comment lines, and that bad lines are reported."""
+        code = ["# header\n", "\n", "  start:  \n", "  ASSIGN x, 1  \n", "HALT\n"]
+        self.vm.load_program(code)
+        self.assertEqual(self.vm.labels['start'], 0)
+        self.assertEqual([instr.line_num for instr in self.vm.program], [3, 4])
+        self.assertEqual(self.vm.program[0].operands, ('x', 1))
+        self.vm.load_program(["\fstart:\v", "\r ASSIGN\fx, 1 \r", "\x0bHALT\x0c"])  # Any whitespace is trimmed
+        self.assertEqual(self.vm.labels['start'], 0)
+        self.assertEqual(self.vm.program[0].operands, ('x', 1))
+        self.assertEqual(self.vm.program[1].opcode, 'HALT')
+        with self.assertRaisesRegex(ValueError, "Syntax error at line 2: '-5'"):
+            self.vm.load_program(["ASSIGN x, 1", "  -5 ", "HALT"])
+
+    def test_load_program_operand_count(self):
+        """Tests that instructions with too many or too few operands are rejected at load time."""
+        with self.assertRaisesRegex(ValueError, "ADD expects 3 operands, but got 4 at line 1"):
+            self.vm.load_program(["ADD x, 1, 2, 3", "HALT"])
+        with self.assertRaisesRegex(ValueError, "ASSIGN expects 2 operands, but got 3 at line 2"):
+            self.vm.load_program(["HALT", 'ASSIGN s, "a,b"'])
+        with self.assertRaisesRegex(ValueError, "INDEX_LOAD expects 3 operands, but got 2 at line 1"):
+            self.vm.load_program(["INDEX_LOAD v, arr"])
+        with self.assertRaisesRegex(ValueError, "RETURN expects 0 to 1 operands, but got 2 at line 1"):
+            self.vm.load_program(["RETURN a, b"])
+
+    def test_load_program_literal_target(self):
+        """Tests that instructions writing to a literal instead of a variable are rejected at load time."""
+        with self.assertRaisesRegex(ValueError, "ASSIGN needs a variable to store into, but got 0 at line 2"):
+            self.vm.load_program(["ASSIGN x, 5", "ASSIGN 0, 99", "PRINT x"])
+        with self.assertRaisesRegex(ValueError, "ADD needs a variable to store into, but got 1 at line 1"):
+            self.vm.load_program(["ADD 1, x, y"])
+        with self.assertRaisesRegex(ValueError, "INDEX_LOAD needs a variable to store into, but got 'v' at line 1"):
+            self.vm.load_program(['INDEX_LOAD "v", arr, 0'])
+        for line in ["STRLEN 1.5, s", "LT true, a, b"]:
+            with self.assertRaises(ValueError):
+                self.vm.load_program([line])
+        self.vm.load_program(["INDEX_STORE arr, 0, 1", "DEREF_STORE p, 2", "CALL f, 0, 0", "f:", "RETURN"])
+
+    def _round_trip_state(self, vm_state):
+        """Yields vm_state exported and imported again, with orjson if it is installed and without."""
+        for backend in ((orjson, None) if orjson is not None else (None,)):
+            with self.subTest(orjson=backend is not None), patch('controller.orjson', backend):
+                f = io.BytesIO()
+                _dump_state(vm_state, f)
+                f.seek(0)
+                yield _load_state(f)
+
+    def test_state_file_big_int(self):
+        """Tests that exported VM states keep integers beyond 64 bits exact."""
+        vm_state = {'pc': 3, 'global_memory': {'f': 2 ** 70, 'n': -2 ** 65, 'x': 1.5}}
+        for loaded in self._round_trip_state(vm_state):
+            self.assertEqual(loaded, vm_state)
+        # orjson would read the integer as a float, so it must be left to the stdlib
+        with patch('controller.orjson') as mock_orjson:
+            self.assertEqual(_load_state(io.BytesIO(b'{"f": 1180591620717411303424}')), {'f': 2 ** 70})
+            mock_orjson.loads.assert_not_called()
+
+    def test_state_file_non_finite_float(self):
+        """Tests that exported VM states keep inf and nan floats, which orjson writes as null."""
+        vm_state = {'global_memory': {'a': math.inf, 'x': 1.5}, 'heap': [None, -math.inf, [math.nan]]}
+        for loaded in self._round_trip_state(vm_state):
+            self.assertEqual(loaded['global_memory'], {'a': math.inf, 'x': 1.5})
+            self.assertEqual(loaded['heap'][:2], [None, -math.inf])
+            self.assertTrue(math.isnan(loaded['heap'][2][0]))
+
+    def test_restore_vm_state_subset(self):
+        """Tests that restoring only some sections of a VM state leaves the others untouched."""
+        self.vm.load_program(["ALLOC_HEAP p, 1", "DEREF_STORE p, 5", "ASSIGN x, 1", "HALT"])
+        for _ in range(3):
+            self.vm.step()
+        heap = self.vm.heap
+        controller = AppController.__new__(AppController)  # No Tk window is needed to restore a state
+        controller.vm = self.vm
+        vm_state = {
+            'pc': 0, 'global_memory': {'x': 2, 'y': 3},
+            'call_stack': [{'func_name': 'f', 'return_address': 3, 'return_var_name': 'r',
+                            'locals': {'ARG0': 4}, 'params': {'ARG0': 4}}],
+            'heap': [], 'heap_size': 10, 'heap_top': 0, 'free_heap_slots': [],
+        }
+        controller._restore_vm_state(vm_state, {'global_memory'})
+        self.assertEqual(self.vm.get_global('x'), 2)
+        self.assertEqual(self.vm.get_global('y'), 3)
+        self.assertEqual(self.vm.pc, 3)
+        self.assertEqual(self.vm.call_stack, [])
+        self.assertIs(self.vm.heap, heap)
+        self.assertEqual(self.vm.heap[0], 5)  # p's cell
+
+    def test_every_opcode_has_handler(self):
+        """Tests that the dispatch table covers every opcode."""
+        self.assertEqual(set(self.vm._op_table), set(Op))
+        self.assertEqual(set(_OPERAND_COUNTS), set(Op))
+
     def test_step_assignment(self):
         """Tests the ASSIGN instruction."""
         code = ["ASSIGN x, 100"]
         self.vm.load_program(code)
         self.vm.step()
-        self.assertEqual(self.vm.global_memory.get('x'), 100)
+        self.assertEqual(self.vm.get_global('x'), 100)
         self.assertEqual(self.vm.pc, 1)
 
+    def test_step_string_literal(self):
+        """Tests that a quoted string literal is used as-is rather than looked up as a variable."""
+        code = [
+            'ASSIGN hi, "bye"',
+            'ASSIGN s, "hi"'
+        ]
+        self.vm.load_program(code)
+        self.vm.step()
+        self.vm.step()
+        self.assertEqual(self.vm.get_global('s'), "hi")
+
     def test_step_arithmetic(self):
         """Tests an arithmetic instruction like ADD."""
         code = [
@@ -90,7 +224,7 @@ class TestVM(unittest.TestCase):
         self.vm.load_program(code)
         self.vm.step()  # Execute ASSIGN
         self.vm.step()  # Execute ADD
-        self.assertEqual(self.vm.global_memory.get('res'), 8)
+        self.assertEqual(self.vm.get_global('res'), 8)
         self.assertEqual(self.vm.pc, 2)
 
     def test_step_division_by_zero(self):
@@ -117,8 +251,8 @@ class TestVM(unittest.TestCase):
         self.vm.step() # Execute JUMP
         self.assertEqual(self.vm.pc, 2)
         self.vm.step() # Execute ASSIGN y, 2
-        self.assertEqual(self.vm.global_memory.get('y'), 2)
-        self.assertIsNone(self.vm.global_memory.get('x'))
+        self.assertEqual(self.vm.get_global('y'), 2)
+        self.assertIsNone(self.vm.get_global('x'))
 
     def test_step_conditional_jump_true(self):
         """Tests JUMPT when the condition is true."""
@@ -171,17 +305,42 @@ class TestVM(unittest.TestCase):
         frame = self.vm.call_stack[0]
         self.assertEqual(frame.func_name, 'my_func')
         self.assertEqual(frame.return_address, 2)
-        self.assertEqual(frame.params['ARG0'], 10)
+        self.assertEqual(frame.params[0], 10)
 
         # Step 3: ADD temp, ARG0, 5
         self.vm.step()
-        self.assertEqual(frame.locals['temp'], 15)
+        self.assertEqual(self.vm.get_local('temp'), 15)
 
         # Step 4: RETURN temp
         self.vm.step()
         self.assertEqual(self.vm.pc, 2) # Returned to instruction after CALL
         self.assertEqual(len(self.vm.call_stack), 0)
-        self.assertEqual(self.vm.global_memory['result'], 15)
+        self.assertEqual(self.vm.get_global('result'), 15)
+
+    def test_frame_reuse(self):
+        """Tests that a frame released by RETURN is reused, without the previous call's variables."""
+        code = [
+            "CALL f, 0, r1",
+            "CALL g, 0, r2",
+            "HALT",
+            "f:",
+            "ASSIGN seen, 1",
+            "RETURN seen",
+            "g:",
+            "RETURN seen"
+        ]
+        self.vm.load_program(code)
+        self.vm.step()  # CALL f
+        first_frame = self.vm.call_stack[-1]
+        self.vm.step()  # ASSIGN
+        self.vm.step()  # RETURN
+        self.vm.step()  # CALL g
+        self.assertIs(self.vm.call_stack[-1], first_frame)
+        self.assertEqual(first_frame.func_name, 'g')
+        self.assertEqual(first_frame.return_address, 2)
+        self.vm.step()  # RETURN
+        self.assertEqual(self.vm.get_global('r1'), 1)
+        self.assertIsNone(self.vm.get_global('r2'))
 
     def test_heap_alloc_and_dereference(self):
         """Tests ALLOC_HEAP, DEREF_STORE, and DEREF_LOAD."""
@@ -194,7 +353,7 @@ class TestVM(unittest.TestCase):
 
         # Step 1: ALLOC_HEAP
         self.vm.step()
-        ptr_addr = self.vm.global_memory.get('ptr')
+        ptr_addr = self.vm.get_global('ptr')
         self.assertIsInstance(ptr_addr, int)
 
         # Step 2: DEREF_STORE
@@ -203,7 +362,348 @@ class TestVM(unittest.TestCase):
 
         # Step 3: DEREF_LOAD
         self.vm.step()
-        self.assertEqual(self.vm.global_memory.get('val'), 123)
+        self.assertEqual(self.vm.get_global('val'), 123)
+
+    def test_heap_block_alloc_and_index(self):
+        """Tests that ALLOC_HEAP returns contiguous blocks and reuses freed single slots."""
+        code = [
+            "ALLOC_HEAP a, 1",
+            "ALLOC_HEAP b, 1",
+            "FREE_HEAP a",
+            "ALLOC_HEAP arr, 3",
+            "INDEX_STORE arr, 2, 7",
+            "INDEX_LOAD v, arr, 2",
+            "ALLOC_HEAP c, 1"
+        ]
+        self.vm.load_program(code)
+        for _ in code:
+            self.assertTrue(self.vm.step())
+        a, b, arr = self.vm.get_global('a'), self.vm.get_global('b'), self.vm.get_global('arr')
+        self.assertEqual(self.vm.get_global('v'), 7)
+        self.assertEqual(arr, b + 1)  # The freed slot is too small for the array
+        self.assertEqual(self.vm.get_global('c'), a)  # ...so the next single slot reuses it
+        self.assertEqual(list(self.vm.heap_alive[a:arr + 3]), [1, 1, 1, 1, 1])
+
+    def test_heap_growth_doubles(self):
+        """Tests that the heap at least doubles when an allocation does not fit."""
+        self.vm.load_program(["ALLOC_HEAP a, 150", "ALLOC_HEAP b, 60", "HALT"])
+        self.vm.step()
+        self.assertEqual(len(self.vm.heap), 200)
+        self.vm.step()
+        self.assertEqual(len(self.vm.heap), 400)
+        self.assertEqual(len(self.vm.heap_alive), len(self.vm.heap))
+        self.assertEqual(self.vm.get_global('b'), 150)
+
+    def test_run_until_breakpoint(self):
+        """Tests that run_until pauses before an instruction on a breakpoint line."""
+        code = [
+            "ASSIGN x, 1",
+            "ASSIGN y, 2",
+            "HALT"
+        ]
+        self.vm.load_program(code)
+        self.assertTrue(self.vm.run_until(bytearray([0, 1, 0])))
+        self.assertEqual(self.vm.pc, 1)
+        self.assertEqual(self.vm.get_global('x'), 1)
+        self.assertIsNone(self.vm.get_global('y'))
+
+        # With no breakpoints the program runs to completion
+        self.vm.step()
+        self.assertFalse(self.vm.run_until())
+        self.assertTrue(self.vm.halted)
+        self.assertEqual(self.vm.get_global('y'), 2)
+
+
+    def test_specialized_arithmetic(self):
+        """Tests the kind-specialized handlers run_until_halt uses for arithmetic, in and out of a call."""
+        code = [
+            "ASSIGN base, 10",
+            "PARAM 4",
+            "CALL scale, 1, r",
+            "SUB neg, 0, r",
+            "MOD m, r, 4",
+            "HALT",
+            "scale:",
+            "ADD s, ARG0, base",
+            "MUL t, s, 3",
+            "RETURN t"
+        ]
+        self.vm.load_program(code)
+        self.assertIsNot(self.vm.program[3].fast_handler, self.vm.program[3].handler)
+        self.vm.run_until_halt()
+        self.assertEqual(self.vm.get_global('r'), 42)
+        self.assertEqual(self.vm.get_global('neg'), -42)
+        self.assertEqual(self.vm.get_global('m'), 2)
+        self.assertIsNone(self.vm.get_global('s'))  # Only assigned in the function's frame
+
+    @patch('vm.messagebox')
+    def test_specialized_division_by_zero(self, mock_messagebox):
+        """Tests that a specialized DIV reports division by zero like the generic handler."""
+        self.vm.load_program(["ASSIGN z, 0", "DIV q, 1, z", "HALT"])
+        self.vm.run_until_halt()
+        self.assertEqual(self.vm.pc, 1)
+        self.assertIn("Division by zero", mock_messagebox.showerror.call_args[0][1])
+
+    @patch('vm.messagebox')
+    def test_specialized_literal_divisor(self, mock_messagebox):
+        """Tests DIV and MOD by literal divisors, which are checked for zero at load time."""
+        self.vm.load_program(["ASSIGN a, 7", "DIV q, a, 2", "MOD m, a, 4", "MOD z, a, 0", "HALT"])
+        self.assertIs(self.vm.program[3].fast_handler, self.vm.program[3].handler)
+        self.vm.run_until_halt()
+        self.assertEqual(self.vm.get_global('q'), 3.5)
+        self.assertEqual(self.vm.get_global('m'), 3)
+        self.assertEqual(self.vm.pc, 3)
+        self.assertIn("Modulo by zero", mock_messagebox.showerror.call_args[0][1])
+
+    def test_run_until_halt(self):
+        """Tests that run_until_halt runs a loop with a function call to completion."""
+        code = [
+            "ASSIGN i, 0",
+            "ASSIGN total, 0",
+            "loop:",
+            "LT more, i, 3",
+            "JUMPF done, more",
+            "PARAM i",
+            "CALL double, 1, d",
+            "ADD total, total, d",
+            "ADD i, i, 1",
+            "JUMP loop",
+            "done:",
+            "HALT",
+            "double:",
+            "MUL r, ARG0, 2",
+            "RETURN r"
+        ]
+        self.vm.load_program(code)
+        self.vm.run_until_halt()
+        self.assertTrue(self.vm.halted)
+        self.assertFalse(self.vm.running)
+        self.assertEqual(self.vm.get_global('total'), 6)
+        self.assertEqual(self.vm.pc, 10)
+
+    def test_run_until_halt_max_steps(self):
+        """Tests that run_until_halt can stop after a number of steps and resume later."""
+        code = ["ASSIGN x, 1", "PRINT x", "ASSIGN z, 3", "HALT"]
+        self.vm.load_program(code)
+        self.vm.run_until_halt(max_steps=2)
+        self.assertTrue(self.vm.running)
+        self.assertEqual(self.vm.pc, 2)
+        self.assertIsNone(self.vm.get_global('z'))
+        self.vm.run_until_halt(max_steps=2)
+        self.assertTrue(self.vm.halted)
+        self.assertEqual(self.vm.get_global('z'), 3)
+
+    @patch('vm.messagebox')
+    def test_run_until_halt_basic_blocks(self, mock_messagebox):
+        """Tests that straight-line runs of arithmetic execute as one block, and that errors name their line."""
+        code = [
+            "ASSIGN i, 0",
+            "ASSIGN s, 0",
+            "loop:",
+            "LT c, i, 4",
+            "JUMPF done, c",
+            "MUL t, i, 3",
+            "ADD s, s, t",
+            "ADD i, i, 1",
+            "JUMP loop",
+            "done:",
+            "DIV bad, s, i",
+            "SUB s, s, i",
+            "DIV bad, s, 0",
+            "HALT"
+        ]
+        self.vm.load_program(code)
+        block = self.vm.program[4].fast_handler
+        self.vm.run_until_halt(max_steps=4)  # Setup block, loop test, body block, JUMP
+        self.assertEqual(self.vm.pc, 2)
+        self.assertEqual(self.vm.get_global('i'), 1)
+        self.assertEqual(self.vm.program[4].fast_handler, block)
+        self.vm.run_until_halt()
+        self.assertEqual(self.vm.get_global('s'), 14)
+        self.assertFalse(self.vm.running)
+        self.assertEqual(self.vm.pc, 10)  # The DIV by a literal zero, after a block of two
+        self.assertIn("3AC line 12", mock_messagebox.showerror.call_args[0][1])
+
+    @patch('vm.messagebox')
+    def test_run_until_halt_inline_indexing(self, mock_messagebox):
+        """Tests inline INDEX_LOAD/INDEX_STORE, with unusual operands handled and errors reported as before."""
+        code = [
+            "ALLOC_HEAP arr, 3",
+            "ASSIGN i, 2",
+            "INDEX_STORE arr, i, 9",
+            "INDEX_LOAD v, arr, i",
+            "INDEX_LOAD w, arr, true",
+            "ADD j, i, 500",
+            "INDEX_LOAD bad, arr, j",
+            "HALT"
+        ]
+        self.vm.load_program(code)
+        self.vm.run_until_halt()
+        self.assertEqual(self.vm.get_global('v'), 9)
+        self.assertIsNone(self.vm.get_global('w'))
+        self.assertEqual(self.vm.pc, 6)
+        self.assertIn("Address 502 is out of bounds", mock_messagebox.showerror.call_args[0][1])
+
+    def test_run_until_halt_fused_branch(self):
+        """Tests the comparison and ASSIGN superinstructions used for a following JUMPT/JUMPF."""
+        code = [
+            "ASSIGN flag, false",
+            "JUMPT skip, flag",
+            "GT big, 5, 3",
+            "JUMPF skip, big",
+            "ASSIGN x, 1",
+            "skip:",
+            "HALT"
+        ]
+        self.vm.load_program(code)
+        # Fused args are (jump if true, target PC, fall-through PC past the jump)
+        self.assertEqual(self.vm.program[0].args[2:], (True, 5, 2))
+        self.assertEqual(self.vm.program[2].args[3:], (False, 5, 4))
+        self.assertIsNot(self.vm.program[2].fast_handler, self.vm.program[2].handler)
+        self.vm.run_until_halt()
+        self.assertTrue(self.vm.halted)
+        self.assertIs(self.vm.get_global('flag'), False)
+        self.assertIs(self.vm.get_global('big'), True)
+        self.assertEqual(self.vm.get_global('x'), 1)
+
+    def test_run_until_halt_constant_branches(self):
+        """Tests that JUMPT/JUMPF on a literal condition are folded for run_until_halt."""
+        code = [
+            "JUMPT first, true",
+            "ASSIGN x, 1",
+            "first:",
+            "JUMPF second, 1",
+            "ASSIGN y, 2",
+            "second:",
+            "HALT"
+        ]
+        self.vm.load_program(code)
+        self.assertEqual(self.vm.program[0].fast_handler, self.vm._op_jump)
+        self.assertEqual(self.vm.program[2].fast_handler, self.vm._op_fall_through)
+        self.vm.run_until_halt()
+        self.assertTrue(self.vm.halted)
+        self.assertIsNone(self.vm.get_global('x'))
+        self.assertEqual(self.vm.get_global('y'), 2)
+
+    def test_run_until_halt_vector_loop(self):
+        """Tests that an element-wise array loop gives the same results in bulk as when stepped."""
+        code = [
+            "ALLOC_HEAP a, 5",
+            "ALLOC_HEAP b, 5",
+            "ASSIGN j, 0",
+            "fill:",
+            "LT more, j, 5",
+            "JUMPF filled, more",
+            "MUL sq, j, j",
+            "INDEX_STORE a, j, sq",
+            "INDEX_STORE b, j, j",
+            "ADD j, j, 1",
+            "JUMP fill",
+            "filled:",
+            "ASSIGN i, 1",
+            "loop:",
+            "LT c, i, 5",
+            "JUMPF done, c",
+            "INDEX_LOAD x, a, i",
+            "INDEX_LOAD y, b, i",
+            "SUB z, x, y",
+            "INDEX_STORE a, i, z",
+            "ADD i, i, 1",
+            "JUMP loop",
+            "done:",
+            "HALT"
+        ]
+        names = ('i', 'c', 'x', 'y', 'z')
+        self.vm.load_program(code)
+        while self.vm.step():
+            pass
+        stepped = ([self.vm.get_global(name) for name in names], self.vm.heap[:10])
+
+        self.vm.load_program(code)
+        self.assertIsInstance(self.vm.program[11].fast_handler, functools.partial)
+        self.vm.run_until_halt()
+        self.assertTrue(self.vm.halted)
+        self.assertEqual(([self.vm.get_global(name) for name in names], self.vm.heap[:10]), stepped)
+        self.assertEqual(self.vm.heap[:5], [0, 0, 2, 6, 12])
+
+    def test_run_until_halt_vector_loop_error(self):
+        """Tests that a failing array loop stops at the bad element, trying the bulk run only once."""
+        code = [
+            "ALLOC_HEAP a, 6",
+            "ALLOC_HEAP b, 6",
+            "ASSIGN j, 0",
+            "fill:",
+            "LT more, j, 4",
+            "JUMPF filled, more",
+            "INDEX_STORE a, j, j",
+            "INDEX_STORE b, j, j",
+            "ADD j, j, 1",
+            "JUMP fill",
+            "filled:",
+            "ASSIGN i, 0",
+            "loop:",
+            "LT c, i, 6",
+            "JUMPF done, c",
+            "INDEX_LOAD x, a, i",
+            "INDEX_LOAD y, b, i",
+            "SUB z, x, y",
+            "INDEX_STORE a, i, z",
+            "ADD i, i, 1",
+            "JUMP loop",
+            "done:",
+            "HALT"
+        ]
+        self.vm.load_program(code)
+        self.vm.run_until_halt()
+        self.assertFalse(self.vm.running)
+        self.assertEqual(self.vm.pc, 14)  # The SUB of the None in b[4]
+        self.assertEqual(self.vm.get_global('i'), 4)
+        self.assertEqual(self.vm.heap[:4], [0, 0, 0, 0])
+        # Recorded when the loop started and not retried, which would have moved the start on
+        self.assertEqual(list(self.vm._failed_vector_loops.values()), [(self.vm.global_memory, 0)])
+        self.mock_messagebox.showerror.assert_called_once()
+
+    def test_run_until_halt_compiled_call(self):
+        """Tests that a pure function is compiled for run_until_halt, and that others are interpreted."""
+        code = [
+            "PARAM 10",
+            "CALL my_func, 1, result",
+            "PARAM 0",
+            "CALL my_func, 1, zero",
+            "HALT",
+            "my_func:",
+            "ADD temp, ARG0, 5",
+            "MUL temp, temp, 2",
+            "RETURN temp"
+        ]
+        self.vm.load_program(code)
+        self.vm.run_until_halt()
+        self.assertTrue(self.vm.halted)
+        self.assertEqual(self.vm.get_global('result'), 30)
+        self.assertEqual(self.vm.get_global('zero'), 10)
+        self.assertIsNotNone(self.vm.functions['my_func'].compiled[1])
+
+        # Reads a global, so it must go through the interpreter
+        self.vm.load_program(["ASSIGN g, 1", "CALL f, 0, r", "HALT", "f:", "RETURN g"])
+        self.vm.run_until_halt()
+        self.assertEqual(self.vm.get_global('r'), 1)
+        self.assertIsNone(self.vm.functions['f'].compiled[0])
+
+        # A failing compiled call is re-run by the interpreter to report the error
+        self.vm.load_program(["PARAM 0", "CALL f, 1, r", "HALT", "f:", "DIV q, 1, ARG0", "RETURN q"])
+        self.vm.run_until_halt()
+        self.assertFalse(self.vm.running)
+        self.assertEqual(self.vm.pc, 3)
+        self.assertIn("Division by zero", self.console_mock.get_messages())
+
+    def test_run_until_halt_error(self):
+        """Tests that a runtime error stops run_until_halt with the PC on the failing instruction."""
+        code = ["ASSIGN x, 1", "DIV y, x, 0", "HALT"]
+        self.vm.load_program(code)
+        self.vm.run_until_halt()
+        self.assertFalse(self.vm.running)
+        self.assertEqual(self.vm.pc, 1)
+        self.mock_messagebox.showerror.assert_called_once()
 
 
 if __name__ == '__main__':
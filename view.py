@@ -32,6 +32,7 @@ class AppView:
         file_menu.add_command(label="Load 3AC File...", command=self.controller.load_file)
         file_menu.add_separator()
         file_menu.add_command(label="Import VM State...", command=self.controller.import_vm_state)
+        file_menu.add_command(label="Import Variables Only...", command=self.controller.import_vm_variables)
         file_menu.add_command(label="Export VM State...", command=self.controller.export_vm_state)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.controller.exit_app)
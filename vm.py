@@ -1,11 +1,226 @@
+import functools
+import itertools
+import operator
 import re
+import sys
 import tkinter as tk
 from tkinter import messagebox
 
-from instruction import Instruction
+from func_info import FuncInfo
+from instruction import Instruction, Op
 from stack_frame import StackFrame
 
 
+# One source line, matched over the whole program at once: a label definition, an opcode with its operands,
+# or text that is neither. Blank and comment lines match with no group set, so match i is line i.
+# [^\S\n] is any whitespace but a newline, so lines are trimmed as str.strip() would trim them.
+_LINE_RE = re.compile(
+    r'^[^\S\n]*(?:#[^\n]*|(?P<label>[^\n]*?):|(?P<opcode>\w+)[^\S\n]*(?P<operands>[^\n]*?)|(?P<invalid>[^\n]+?))?'
+    r'[^\S\n]*$',
+    re.MULTILINE)
+_OPERAND_SEP_RE = re.compile(r'\s*,\s*')
+_INT_RE = re.compile(r'-?\d+$')
+_FLOAT_RE = re.compile(r'-?\d+\.\d*$')
+_ARG_RE = re.compile(r'ARG\d+$')
+
+# Operand kinds, decoded once per operand by VM.load_program. Literal kinds sort below KIND_VAR.
+KIND_BOOL = 0
+KIND_INT = 1
+KIND_FLOAT = 2
+KIND_STR = 3
+KIND_LABEL = 4  # A jump target that has been resolved to a PC
+KIND_VAR = 5
+KIND_ARG = 6  # A function parameter name: ARG0, ARG1, ...
+
+
+@functools.lru_cache(maxsize=4096)
+def _classify_operand(op_str):
+    """
+    Parses one operand string into a (kind, value) pair.
+    Cached because the same operands repeat throughout a program.
+    """
+    if op_str.lower() == 'true':
+        return KIND_BOOL, True
+    if op_str.lower() == 'false':
+        return KIND_BOOL, False
+    # Check for string literal first, as it might contain numbers
+    if op_str.startswith('"') and op_str.endswith('"'):
+        return KIND_STR, op_str[1:-1]  # Return the string content without quotes
+    if _INT_RE.match(op_str):  # Integer
+        return KIND_INT, int(op_str)
+    if _FLOAT_RE.match(op_str):  # Float
+        return KIND_FLOAT, float(op_str)
+    # Identifiers are interned so that scope dict lookups compare keys by identity
+    if _ARG_RE.match(op_str):
+        return KIND_ARG, sys.intern(op_str)
+    return KIND_VAR, sys.intern(op_str)  # Assume variable name
+
+
+# Comparisons that can be fused with a following JUMPT/JUMPF into one superinstruction
+_COMPARISONS = {
+    Op.EQ: operator.eq, Op.NE: operator.ne, Op.LT: operator.lt,
+    Op.LE: operator.le, Op.GT: operator.gt, Op.GE: operator.ge,
+}
+
+# Element-wise operations that an array loop can be run with in bulk (see VM._match_vector_loop)
+_VECTOR_OPS = {Op.ADD: operator.add, Op.SUB: operator.sub, Op.MUL: operator.mul}
+
+# Number of operands each opcode takes, as (fewest, most); checked once by VM.load_program
+_OPERAND_COUNTS = {
+    Op.ASSIGN: (2, 2), Op.CONST_ASSIGN: (2, 2),
+    Op.ADD: (3, 3), Op.SUB: (3, 3), Op.MUL: (3, 3), Op.DIV: (3, 3), Op.MOD: (3, 3),
+    Op.EQ: (3, 3), Op.NE: (3, 3), Op.LT: (3, 3), Op.LE: (3, 3), Op.GT: (3, 3), Op.GE: (3, 3),
+    Op.OR: (3, 3), Op.AND: (3, 3),
+    Op.CONCAT: (3, 3), Op.STRLEN: (2, 2), Op.GETCHAR: (3, 3),
+    Op.JUMP: (1, 1), Op.JUMPT: (2, 2), Op.JUMPF: (2, 2),
+    Op.PARAM: (1, 1), Op.REF_PARAM: (1, 1), Op.CALL: (3, 3), Op.RETURN: (0, 1),
+    Op.PRINT: (1, 1), Op.HALT: (0, 0), Op.UMINUS: (2, 2),
+    Op.ALLOC_HEAP: (2, 2), Op.FREE_HEAP: (1, 1), Op.ADDR_OF: (2, 2),
+    Op.DEREF_LOAD: (2, 2), Op.DEREF_STORE: (2, 2), Op.INDEX_LOAD: (3, 3), Op.INDEX_STORE: (3, 3),
+}
+
+# Opcodes whose operand 0 is the variable they write; checked to be a variable by VM.load_program
+_TARGET_OPS = frozenset({
+    Op.ASSIGN, Op.CONST_ASSIGN, Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.MOD,
+    Op.EQ, Op.NE, Op.LT, Op.LE, Op.GT, Op.GE, Op.OR, Op.AND, Op.UMINUS,
+    Op.CONCAT, Op.STRLEN, Op.GETCHAR, Op.ALLOC_HEAP, Op.ADDR_OF, Op.DEREF_LOAD, Op.INDEX_LOAD,
+})
+
+# Python expressions for the opcodes a compiled function body may use (see VM._compile_function).
+# {1} and {2} stand for the instruction's source operands; operand 0 is the target variable.
+_INLINE_EXPRESSIONS = {
+    Op.ASSIGN: '{1}', Op.UMINUS: '-{1}',
+    Op.ADD: '{1} + {2}', Op.SUB: '{1} - {2}', Op.MUL: '{1} * {2}', Op.DIV: '{1} / {2}', Op.MOD: '{1} % {2}',
+    Op.EQ: '{1} == {2}', Op.NE: '{1} != {2}', Op.LT: '{1} < {2}',
+    Op.LE: '{1} <= {2}', Op.GT: '{1} > {2}', Op.GE: '{1} >= {2}',
+    Op.OR: '{1} or {2}', Op.AND: '{1} and {2}', Op.CONCAT: 'str({1}) + str({2})',
+}
+
+
+class _Halt(Exception):
+    """Raised by the HALT handler to leave the run loops. Other handlers return the next PC when they transfer control, else None."""
+
+
+# Marks a variable slot that has not been assigned in a scope, so lookups can fall back to globals
+_UNSET = object()
+
+
+@functools.lru_cache(maxsize=256)
+def _arg_name(i):
+    """Returns the interned parameter name ARG<i>."""
+    return sys.intern(f'ARG{i}')
+
+
+class _InstructionFailed(Exception):
+    """Raised by a basic-block handler when one of its instructions fails, giving that instruction's PC."""
+
+    def __init__(self, pc, error):
+        super().__init__(pc, error)
+        self.pc = pc
+        self.error = error
+
+
+# Source lines that read source operand {i} into v{i}, for a variable and for a literal (see _inline_lines)
+_LOAD_VARIABLE = [
+    "    v{i} = scope[args[{i}]]",
+    "    if v{i} is _UNSET:",
+    "        v{i} = memory[args[{i}]]",
+    "        if v{i} is _UNSET:",
+    "            v{i} = None",
+]
+_LOAD_LITERAL = ["    v{i} = args[{i}]"]
+_ZERO_DIVISOR_ERRORS = {Op.DIV: "Division by zero", Op.MOD: "Modulo by zero"}
+
+# Inline heap indexing. Only the in-bounds case with int operands is written out; anything else goes
+# through the generic handler {instr} belongs to, which either handles it or raises the usual error.
+_INDEX_BODIES = {
+    Op.INDEX_LOAD: [
+        "    heap = self.heap",
+        "    if type(v1) is int and type(v2) is int and 0 <= v1 < len(heap) and 0 <= v1 + v2 < len(heap):",
+        "        scope[args[0]] = heap[v1 + v2]",
+        "    else:",
+        "        self._op_index_load({instr})",
+    ],
+    Op.INDEX_STORE: [
+        "    heap = self.heap",
+        "    if type(v0) is int and type(v1) is int and 0 <= v0 < len(heap) and 0 <= v0 + v1 < len(heap):",
+        "        heap[v0 + v1] = v2",
+        "        self._heap_dirty = True",
+        "    else:",
+        "        self._op_index_store({instr})",
+    ],
+}
+
+
+def _inline_operand_count(op):
+    """Returns how many operands an instruction needs for _inline_lines to run it, or None if it can't."""
+    if op in _INDEX_BODIES:
+        return 3
+    if op in _INLINE_EXPRESSIONS:
+        return _INLINE_EXPRESSIONS[op].count('{') + 1
+    return None
+
+
+def _first_source(op):
+    """Returns the index of an inlinable opcode's first source operand. INDEX_STORE has no target operand."""
+    return 0 if op == Op.INDEX_STORE else 1
+
+
+def _inline_lines(op, variable_sources, jump_if=None, instr_name='instr'):
+    """
+    Returns the source lines that run one instruction of an opcode in _INLINE_EXPRESSIONS or
+    _INDEX_BODIES, given its args in `args`, the instruction itself in the variable instr_name, the
+    current scope in `scope` and global memory in `memory`. Source operands, from _first_source(op)
+    on, are variables where variable_sources is True and literals elsewhere. Reads fall back from the
+    current frame to global memory exactly as VM._load_slot does. If jump_if is not None, the
+    instruction is fused with the JUMPT (True) or JUMPF (False) after it, and the lines end by
+    returning the next PC.
+    """
+    lines = []
+    for i, is_variable in enumerate(variable_sources, _first_source(op)):
+        lines += [line.format(i=i) for line in (_LOAD_VARIABLE if is_variable else _LOAD_LITERAL)]
+    if op in _INDEX_BODIES:
+        return lines + [line.format(instr=instr_name) for line in _INDEX_BODIES[op]]
+    if op in _ZERO_DIVISOR_ERRORS and variable_sources[1]:
+        # A literal divisor was checked when the handler was chosen, see VM._fuse_instructions
+        lines.append(f"    if v2 == 0: raise ZeroDivisionError({_ZERO_DIVISOR_ERRORS[op]!r})")
+    lines += [
+        f"    result = {_INLINE_EXPRESSIONS[op].format(None, 'v1', 'v2')}",
+        "    scope[args[0]] = result",
+    ]
+    if jump_if is not None:
+        fused = len(variable_sources) + 2  # Index of the jump target in the fused args
+        lines.append(f"    return args[{fused}] if {'' if jump_if else 'not '}result else args[{fused + 1}]")
+    return lines
+
+
+# Start of every generated handler: binds the scopes and flags the one that the handler will write
+_HANDLER_PROLOGUE = [
+    "    call_stack = self.call_stack",
+    "    memory = self.global_memory",
+    "    if call_stack:",
+    "        scope = call_stack[-1].locals",
+    "        self._locals_dirty = True",
+    "    else:",
+    "        scope = memory",
+    "        self._globals_dirty = True",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _specialized_handler(op, variable_sources, jump_if=None):
+    """
+    Returns a handler for one instruction of an inlinable opcode, see _inline_lines.
+    The operand reads, the operation and the store are written out inline, so the instruction
+    costs one Python call instead of one per operand.
+    """
+    lines = ["def handler(self, instr):", "    args = instr.args"] + _HANDLER_PROLOGUE
+    lines += _inline_lines(op, variable_sources, jump_if)
+    namespace = {'_UNSET': _UNSET}
+    exec(compile("\n".join(lines), f"<{op.name} handler>", 'exec'), namespace)
+    return namespace['handler']
+
+
 class VM:
     """
     Virtual Machine to execute 3-Address Code.
@@ -15,210 +230,464 @@ class VM:
     def __init__(self, console_output_widget=None):
         self.program = []  # List of Instruction objects
         self.labels = {}  # Map label name to instruction index
+        self.functions = {}  # Map function name to its FuncInfo, for every label used by a CALL
         self.pc = 0  # Program Counter
-        self.global_memory = {}  # Global variables
+        self.slot_of = {}  # Map variable name to its slot index in global_memory and frame locals
+        self.slot_names = []  # Variable name of each slot; ARG<i> always has slot i
+        self.global_memory = []  # Global variables, indexed by slot
         self.heap = []  # Heap for dynamic allocations (list of values)
-        self.free_heap_slots = []  # Track free slots for simpler memory management (indices)
+        self.heap_top = 0  # Addresses from here up have never been allocated
+        self.free_heap_slots = []  # Freed addresses below heap_top, reused last-in first-out
+        self.heap_alive = bytearray()  # Parallel to the heap: 1 for slots handed out by ALLOC_HEAP
         self.call_stack = []  # Stack of StackFrame objects
+        self._frame_pool = []  # Frames released by RETURN, reused by the next CALL
+        self._failed_vector_loops = {}  # Exit PC -> (scope, start) of a loop whose bulk run raised
         self.current_params = []  # Parameters for the next function call (before CALL instruction)
         self.running = False
         self.halted = False
         self.console_output = console_output_widget  # Tkinter widget for console output
+        self._out_buf = []  # Console messages not yet written to the widget, see _flush_console
+
+        # Opcode dispatch table: one handler method per opcode, bound to each instruction at load time,
+        # so running an instruction is a single call through instr.handler with no lookup by opcode.
+        # The PC is advanced before a handler runs; jumps, calls and returns return the PC to continue at.
+        self._op_table = {
+            Op.ASSIGN: self._op_assign, Op.CONST_ASSIGN: self._op_const_assign,
+            Op.ADD: self._op_add, Op.SUB: self._op_sub, Op.MUL: self._op_mul,
+            Op.DIV: self._op_div, Op.MOD: self._op_mod,
+            Op.EQ: self._op_eq, Op.NE: self._op_ne, Op.LT: self._op_lt,
+            Op.LE: self._op_le, Op.GT: self._op_gt, Op.GE: self._op_ge,
+            Op.OR: self._op_or, Op.AND: self._op_and,
+            Op.CONCAT: self._op_concat, Op.STRLEN: self._op_strlen, Op.GETCHAR: self._op_getchar,
+            Op.JUMP: self._op_jump, Op.JUMPT: self._op_jumpt, Op.JUMPF: self._op_jumpf,
+            Op.PARAM: self._op_param, Op.REF_PARAM: self._op_ref_param,
+            Op.CALL: self._op_call, Op.RETURN: self._op_return,
+            Op.PRINT: self._op_print, Op.HALT: self._op_halt, Op.UMINUS: self._op_uminus,
+            Op.ALLOC_HEAP: self._op_alloc_heap, Op.FREE_HEAP: self._op_free_heap,
+            Op.ADDR_OF: self._op_addr_of, Op.DEREF_LOAD: self._op_deref_load,
+            Op.DEREF_STORE: self._op_deref_store, Op.INDEX_LOAD: self._op_index_load,
+            Op.INDEX_STORE: self._op_index_store,
+        }
         self.reset_state()
 
     def reset_state(self):
         """Resets the VM to its initial state."""
         self.pc = 0
-        self.global_memory = {}
+        self.global_memory = [_UNSET] * len(self.slot_names)
         self.heap = [None] * 100  # Pre-allocate some heap for simplicity, or grow dynamically
-        self.free_heap_slots = list(range(len(self.heap)))  # All slots initially free
+        self.heap_top = 0
+        self.free_heap_slots = []
+        self.heap_alive = bytearray(len(self.heap))
         self.call_stack = []
+        self._frame_pool = []
+        self._failed_vector_loops = {}
         self.current_params = []
         self.running = False
         self.halted = False
+        self._mark_all_dirty()
+        self._out_buf = []
         if self.console_output:
             self.console_output.delete('1.0', tk.END)
             self.console_output.insert(tk.END, "--- VM Console ---\n")
 
-        # Opcode dispatch table for refactored step method
-        self.opcode_handlers = {
-            'ASSIGN': self._handle_assignment, 'CONST_ASSIGN': self._handle_assignment,
-            'ADD': self._handle_arithmetic, 'SUB': self._handle_arithmetic,
-            'MUL': self._handle_arithmetic, 'DIV': self._handle_arithmetic,
-            'MOD': self._handle_arithmetic, 'EQ': self._handle_arithmetic,
-            'NE': self._handle_arithmetic, 'LT': self._handle_arithmetic,
-            'LE': self._handle_arithmetic, 'GT': self._handle_arithmetic,
-            'GE': self._handle_arithmetic, 'OR': self._handle_arithmetic,
-            'AND': self._handle_arithmetic,
-            'CONCAT': self._handle_string, 'STRLEN': self._handle_string,
-            'GETCHAR': self._handle_string,
-            'JUMP': self._handle_jump, 'JUMPT': self._handle_jump,
-            'JUMPF': self._handle_jump,
-            'PARAM': self._handle_function, 'REF_PARAM': self._handle_function,
-            'CALL': self._handle_function, 'RETURN': self._handle_function,
-            'PRINT': self._handle_misc, 'HALT': self._handle_misc,
-            'UMINUS': self._handle_misc,
-            'ALLOC_HEAP': self._handle_heap, 'FREE_HEAP': self._handle_heap,
-            'ADDR_OF': self._handle_heap, 'DEREF_LOAD': self._handle_heap,
-            'DEREF_STORE': self._handle_heap, 'INDEX_LOAD': self._handle_heap,
-            'INDEX_STORE': self._handle_heap,
-        }
+
+    def _mark_all_dirty(self):
+        """Flags every memory region as changed so that the UI redraws all of them."""
+        self._globals_dirty = True  # Global variables were written
+        self._locals_dirty = True  # Variables in the current stack frame were written
+        self._heap_dirty = True  # Heap contents or allocations changed
+        self._stack_dirty = True  # Frames were pushed or popped
 
     def _log_console(self, message):
-        """Writes a message to the console output widget."""
+        """Queues a message for the console output widget. It is written by _flush_console."""
+        self._out_buf.append(message)
+
+    def _flush_console(self):
+        """
+        Writes the queued console messages to the widget with a single insert.
+        Called whenever control returns to the UI: after a step, a run, or a runtime error.
+        """
+        if not self._out_buf:
+            return
         if self.console_output:
-            self.console_output.insert(tk.END, message)
+            self.console_output.insert(tk.END, "".join(self._out_buf))
             self.console_output.see(tk.END)  # Scroll to end
+        self._out_buf.clear()
 
     def load_program(self, tac_code_lines):
         """Parses 3AC code from lines and loads it into the VM."""
+        self.slot_of = {}
+        self.slot_names = []
         self.reset_state()
         self.program = []
         self.labels = {}
+        self.functions = {}
 
         raw_instructions = []
-        for i, line in enumerate(tac_code_lines):
-            line = line.strip()
-            if not line or line.startswith('#'):  # Ignore empty lines and comments
-                continue
-
-            # Check for label definition
-            if line.endswith(':'):
-                label_name = line[:-1]
-                self.labels[label_name] = len(raw_instructions)  # Store PC for this label
-                continue
-
-            # Parse instruction: opcode, operands
-            # Use regex to safely split opcode from the rest of the line, then split operands
-            match = re.match(r'(\w+)\s*(.*)', line)
-            if not match:
-                raise ValueError(f"Syntax error at line {i + 1}: '{line}'")
-
-            opcode = match.group(1).upper()  # Ensure opcode is uppercase
-            operands_str = match.group(2).strip()
-
-            operands = []
+        # Scan the whole program with one regex sweep instead of stripping and matching line by line
+        source = "\n".join(map(str.rstrip, tac_code_lines))
+        for i, match in enumerate(_LINE_RE.finditer(source)):
+            label_name, opcode, operands_str, invalid = match.group('label', 'opcode', 'operands', 'invalid')
+            if opcode is None:
+                if label_name is not None:
+                    self.labels[sys.intern(label_name)] = len(raw_instructions)  # Store PC for this label
+                elif invalid is not None:
+                    raise ValueError(f"Syntax error at line {i + 1}: '{invalid}'")
+                continue  # Empty line or comment
+
+            opcode = opcode.upper()  # Ensure opcode is uppercase
+
+            decoded = []
             if operands_str:
                 # Split by comma, but be careful with strings that might contain commas if implemented
                 # For now, assumes simple comma-separated variables/literals
-                operands = [self._parse_operand_value(op.strip()) for op in operands_str.split(',')]
+                decoded = [_classify_operand(op) for op in _OPERAND_SEP_RE.split(operands_str)]
+            kinds = tuple(kind for kind, _ in decoded)
+            operands = [value for _, value in decoded]
 
-            raw_instructions.append(Instruction(opcode, *operands, line_num=i))
+            instr = Instruction(opcode, *operands, line_num=i)
+            instr.handler = self._op_table.get(instr.op)
+            if instr.handler is None:
+                raise ValueError(f"Unknown or unsupported opcode '{opcode}' at line {i + 1}")
+            fewest, most = _OPERAND_COUNTS[instr.op]
+            if not fewest <= len(operands) <= most:
+                expected = fewest if fewest == most else f"{fewest} to {most}"
+                raise ValueError(
+                    f"{opcode} expects {expected} operands, but got {len(operands)} at line {i + 1}")
+            if instr.op in _TARGET_OPS and kinds[0] < KIND_VAR:
+                raise ValueError(f"{opcode} needs a variable to store into, but got {operands[0]!r} at line {i + 1}")
+            instr.kinds = kinds
+            raw_instructions.append(instr)
 
         self.program = raw_instructions  # Assign after all labels are processed
 
-        # After loading all instructions, ensure labels in jumps are resolved
+        # After loading all instructions, ensure labels in jumps and calls are resolved
         # This pass is necessary because labels might be defined *after* they are used.
-        for instr in self.program:
-            # Handle special cases for labels in jumps
-            if instr.opcode in ['JUMP', 'JUMPT', 'JUMPF']:
+        for pc, instr in enumerate(self.program):
+            if instr.op == Op.CALL:
+                if len(instr.kinds) != 3 or instr.kinds[1] != KIND_INT:
+                    raise ValueError(f"CALL expects a label, a parameter count and a result variable at 3AC line {instr.line_num}")
+                instr.return_address = pc + 1  # Saved in the new frame, so the run loops needn't store the PC
+            if instr.op in (Op.JUMP, Op.JUMPT, Op.JUMPF, Op.CALL):
                 target_label_name = instr.operands[0]  # The label name is the first operand
                 if target_label_name not in self.labels:
                     raise ValueError(f"Undefined label '{target_label_name}' at 3AC line {instr.line_num}")
-                instr.operands[0] = self.labels[target_label_name]  # Replace label name with target PC
+                instr.debug_label = target_label_name
+                # Replace label name with target PC
+                target = (self.labels[target_label_name],)
+                instr.kinds = (KIND_LABEL,) + instr.kinds[1:]
+                instr.args = target + instr.args[1:]
+                if instr.op == Op.CALL:
+                    # CALL keeps the function name in its operands for its stack frames
+                    if target_label_name not in self.functions:
+                        self.functions[target_label_name] = FuncInfo(target_label_name, target[0])
+                    instr.args = (self.functions[target_label_name],) + instr.args[1:]
+                else:
+                    instr.operands = target + instr.operands[1:]
 
+        self._assign_slots()
+        self._fuse_instructions()
         self.running = True
 
-    def _parse_operand_value(self, op_str):
-        """Attempts to convert operand string to int, float, bool, string literal, or keeps as variable name."""
-        if op_str.lower() == 'true':
-            return True
-        if op_str.lower() == 'false':
-            return False
-        # Check for string literal first, as it might contain numbers
-        if op_str.startswith('"') and op_str.endswith('"'):
-            return op_str[1:-1]  # Return the string content without quotes
-        if re.match(r"^-?\d+$", op_str):  # Integer
-            return int(op_str)
-        if re.match(r"^-?\d+\.\d*$", op_str):  # Float
-            return float(op_str)
-        return op_str  # Assume variable name
+    def _assign_slots(self):
+        """
+        Gives every variable in the program a slot index and decodes each instruction's args.
+        ARG0..ARGn are numbered first so that a call's parameters fill the first slots of its frame.
+        """
+        num_args = 0
+        for instr in self.program:
+            if instr.op == Op.CALL:
+                num_args = max(num_args, instr.operands[1])
+            for kind, operand in zip(instr.kinds, instr.operands):
+                if kind == KIND_ARG:
+                    num_args = max(num_args, int(operand[3:]) + 1)
+        for i in range(num_args):
+            self._slot_for(_arg_name(i))
 
-    def _get_operand_value(self, operand_name):
-        """Retrieves the value of an operand from current scope or global memory."""
-        if not isinstance(operand_name, str):
-            return operand_name  # It's a literal value
-        # Try current stack frame locals/params (top of the call stack)
-        if self.call_stack:
-            frame = self.call_stack[-1]
-            if operand_name in frame.locals:
-                val = frame.locals[operand_name]
-                # This variable is not a parameter, so it's not a reference. Return its value.
-                return val
-            if operand_name in frame.params:
-                param_info = frame.params[operand_name]
-                # If param_info is a tuple, it's a reference pointer.
-                # We dereference it here to get the value for the operation.
-                if isinstance(param_info, tuple) and param_info[0] in ('heap', 'global', 'local'):
-                    # This is a pass-by-reference parameter, so we get the value it points to.
-                    return self._get_value_from_pointer(param_info)
+        for instr in self.program:
+            args = list(instr.args)
+            for index, kind in enumerate(instr.kinds):
+                if kind >= KIND_VAR:
+                    args[index] = self._slot_for(instr.operands[index])
+            instr.args = tuple(args)
+
+    def _fuse_instructions(self):
+        """
+        Peephole pass that picks each instruction's fast_handler for run_until_halt.
+        JUMPT/JUMPF on a literal condition become an unconditional jump or a no-op.
+        Assignments, arithmetic, comparisons, logic and heap indexing get a handler specialized to
+        which of their operands are variables, see _specialized_handler. DIV and MOD by a non-zero literal skip the
+        zero test; by a literal zero they keep the generic handler, which reports the error.
+        A comparison or ASSIGN followed by a JUMPT/JUMPF on its result gets a superinstruction
+        that also performs the jump, saving one dispatch. The variable is still written and the
+        jump keeps its own PC, so other jumps to it, step() and breakpoints are unaffected.
+        The fused instruction's args are extended with (jump_if, target_pc, fallthrough_pc).
+        Finally, runs of such instructions are merged into basic blocks, see _form_blocks.
+        """
+        program = self.program
+        inline = {}  # PC -> (variable_sources, jump_if) for instructions with a specialized fast handler
+        for pc, instr in enumerate(program):
+            instr.fast_handler = instr.handler
+            variable_sources = None
+            if (len(instr.kinds) == _inline_operand_count(instr.op)
+                    and (instr.kinds[0] >= KIND_VAR or instr.op == Op.INDEX_STORE)
+                    and not (instr.op in _ZERO_DIVISOR_ERRORS and instr.kinds[2] < KIND_VAR and instr.args[2] == 0)):
+                variable_sources = tuple(kind >= KIND_VAR for kind in instr.kinds[_first_source(instr.op):])
+                instr.fast_handler = _specialized_handler(instr.op, variable_sources).__get__(self)
+                inline[pc] = (variable_sources, None)
+            if instr.op == Op.CALL and instr.kinds[2] >= KIND_VAR:
+                instr.fast_handler = self._op_call_compiled
+            if instr.op in (Op.JUMPT, Op.JUMPF) and instr.kinds[1] < KIND_LABEL:
+                # The condition is a literal, so the branch always or never jumps
+                taken = bool(instr.args[1]) == (instr.op == Op.JUMPT)
+                instr.fast_handler = self._op_jump if taken else self._op_fall_through
+            if pc + 1 == len(program):
+                break
+            branch = program[pc + 1]
+            if (branch.op in (Op.JUMPT, Op.JUMPF) and branch.kinds[1] >= KIND_VAR
+                    and instr.kinds and instr.kinds[0] >= KIND_VAR and branch.args[1] == instr.args[0]):
+                if instr.op in _COMPARISONS:
+                    instr.fast_handler = self._op_compare_branch
+                elif instr.op == Op.ASSIGN:
+                    instr.fast_handler = self._op_assign_branch
                 else:
-                    # It's a pass-by-value parameter
-                    return param_info
+                    continue
+                instr.args = instr.args[:len(instr.kinds)] + (branch.op == Op.JUMPT, branch.args[0], pc + 2)
+                if variable_sources is not None:
+                    instr.fast_handler = _specialized_handler(
+                        instr.op, variable_sources, branch.op == Op.JUMPT).__get__(self)
+                    inline[pc] = (variable_sources, branch.op == Op.JUMPT)
+                plan = self._match_vector_loop(pc)
+                if plan is not None:
+                    instr.fast_handler = functools.partial(self._op_vector_loop, plan)
+                    inline.pop(pc, None)
+        self._form_blocks(inline)
+
+    def _form_blocks(self, inline):
+        """
+        Gives the first instruction of each run of two or more instructions with a specialized fast
+        handler a handler that runs the whole run at once, see _compile_block. inline maps their PCs to
+        (variable_sources, jump_if). A block never continues into a jump target or a CALL's return
+        address, and ends after an instruction fused with a branch, so control can only enter it at
+        its first instruction. The other instructions keep their own fast handlers, for when
+        run_until_halt resumes inside a block after step() or a breakpoint.
+        """
+        entry_points = set(self.labels.values())
+        entry_points.update(instr.return_address for instr in self.program if instr.op == Op.CALL)
+        pc = 0
+        while pc < len(self.program):
+            steps = []
+            next_pc = pc
+            while next_pc in inline and (next_pc == pc or next_pc not in entry_points):
+                steps.append((next_pc,) + inline[next_pc])
+                next_pc += 1
+                if steps[-1][2] is not None:
+                    break  # Fused with a branch
+            if len(steps) >= 2:
+                self.program[pc].fast_handler = self._compile_block(steps)
+            pc = max(next_pc, pc + 1)
+
+    def _compile_block(self, steps):
+        """
+        Returns a fast handler that runs a basic block found by _form_blocks in one generated function:
+        the inline code of each (pc, variable_sources, jump_if) in steps, one after another, with no
+        dispatch in between. The handler returns the PC to continue at. If an instruction fails, it
+        raises _InstructionFailed with that instruction's PC, found from the generated line that raised.
+        """
+        lines = ["def block(self, instr):"] + _HANDLER_PROLOGUE + ["    try:"]
+        line_pcs = {}  # Line number in the generated code -> PC of the instruction it belongs to
+        namespace = {'_UNSET': _UNSET, '_InstructionFailed': _InstructionFailed, 'line_pcs': line_pcs}
+        for pc, variable_sources, jump_if in steps:
+            instr = self.program[pc]
+            namespace[f'args{pc}'] = instr.args
+            namespace[f'instr{pc}'] = instr
+            for line in [f"    args = args{pc}"] + _inline_lines(instr.op, variable_sources, jump_if, f'instr{pc}'):
+                lines.append("    " + line)
+                line_pcs[len(lines)] = pc
+        last_pc, _, jump_if = steps[-1]
+        if jump_if is None:
+            lines.append(f"        return {last_pc + 1}")
+        lines += [
+            "    except Exception as error:",
+            "        raise _InstructionFailed(line_pcs[error.__traceback__.tb_lineno], error) from error",
+        ]
+        exec(compile("\n".join(lines), f"<3AC block at PC {steps[0][0]}>", 'exec'), namespace)
+        return namespace['block'].__get__(self)
+
+    def _match_vector_loop(self, pc):
+        """
+        Recognizes an element-wise array loop whose header is at pc:
+            LT c, i, n / JUMPF <pc + 8>, c / INDEX_LOAD x, a, i / INDEX_LOAD y, b, i /
+            ADD|SUB|MUL z, x, y / INDEX_STORE r, i, z / ADD i, i, 1 / JUMP <pc>
+        Returns the plan used by _op_vector_loop, or None if the code does not have this shape.
+        """
+        body = self.program[pc:pc + 8]
+        if len(body) != 8:
+            return None
+        cmp, branch, load_a, load_b, arith, store, inc, jump = body
+        if ([instr.op for instr in (cmp, branch, load_a, load_b, store, inc, jump)]
+                != [Op.LT, Op.JUMPF, Op.INDEX_LOAD, Op.INDEX_LOAD, Op.INDEX_STORE, Op.ADD, Op.JUMP]
+                or arith.op not in _VECTOR_OPS):
+            return None
+        # Every operand must be a variable, apart from the bound n, the increment and the jump targets
+        if (min(cmp.kinds[:2] + load_a.kinds + load_b.kinds + arith.kinds + store.kinds + inc.kinds[:2]) < KIND_VAR
+                or cmp.kinds[2] not in (KIND_INT, KIND_VAR, KIND_ARG) or inc.kinds[2] != KIND_INT):
+            return None
+        c, i, n = cmp.args[:3]
+        x, a = load_a.args[:2]
+        y, b = load_b.args[:2]
+        z = arith.args[0]
+        r = store.args[0]
+        if (branch.args != (pc + 8, c) or load_a.args[2] != i or load_b.args[2] != i
+                or arith.args[1:] != (x, y) or store.args[1:] != (i, z)
+                or inc.args != (i, i, 1) or jump.args[0] != pc):
+            return None
+        # The loop's scalars must not alias each other or the arrays and bound it reads
+        scalars = {c, i, x, y, z}
+        n_is_var = cmp.kinds[2] >= KIND_VAR
+        if len(scalars) != 5 or scalars & {a, b, r} or (n_is_var and n in scalars):
+            return None
+        return c, i, n, n_is_var, a, b, r, x, y, z, _VECTOR_OPS[arith.op], pc + 8
+
+    def _slot_for(self, var_name):
+        """Returns the slot index of a variable, giving it a new slot if it has none yet."""
+        slot = self.slot_of.get(var_name)
+        if slot is None:
+            slot = len(self.slot_names)
+            self.slot_of[var_name] = slot
+            self.slot_names.append(var_name)
+            self._pad_storage()
+        return slot
+
+    def _pad_storage(self):
+        """Extends global memory and every frame's locals to cover all slots."""
+        num_slots = len(self.slot_names)
+        for storage in [self.global_memory] + [frame.locals for frame in self.call_stack]:
+            if len(storage) < num_slots:
+                storage.extend([_UNSET] * (num_slots - len(storage)))
+
+    def named_variables(self, storage):
+        """Returns {name: value} for the assigned slots of global memory or a frame's locals."""
+        slot_names = self.slot_names
+        return {slot_names[slot]: value for slot, value in enumerate(storage) if value is not _UNSET}
+
+    def named_params(self, frame):
+        """Returns {ARG<i>: value} for the parameters a frame was called with."""
+        return {_arg_name(i): value for i, value in enumerate(frame.params)}
 
-        # Try global memory
-        if operand_name in self.global_memory:
-            # Globals are not passed by reference in this model, so we just return the value.
-            # If a global were passed by reference, its address would be in the current frame's params.
-            return self.global_memory[operand_name]
+    def slots_from(self, variables):
+        """Builds a global memory or frame locals list from a {name: value} dict."""
+        for var_name in variables:
+            self._slot_for(var_name)
+        storage = [_UNSET] * len(self.slot_names)
+        for var_name, value in variables.items():
+            storage[self.slot_of[var_name]] = value
+        return storage
 
+    def get_global(self, var_name):
+        """Returns the value of a global variable, or None if it has not been assigned."""
+        slot = self.slot_of.get(var_name)
+        if slot is None or self.global_memory[slot] is _UNSET:
+            return None
+        return self.global_memory[slot]
+
+    def get_local(self, var_name):
+        """Returns the value of a variable in the current stack frame, or None if it has not been assigned."""
+        slot = self.slot_of.get(var_name)
+        if slot is None or not self.call_stack or self.call_stack[-1].locals[slot] is _UNSET:
+            return None
+        return self.call_stack[-1].locals[slot]
+
+    def _parse_operand_value(self, op_str):
+        """Attempts to convert operand string to int, float, bool, string literal, or keeps as variable name."""
+        return _classify_operand(op_str)[1]
+
+    def _operand_value(self, instr, index):
+        """Returns the value of an instruction's operand, using the kind decoded at load time."""
+        if instr.kinds[index] >= KIND_VAR:
+            return self._load_slot(instr.args[index])
+        return instr.args[index]  # It's a literal value
+
+    def _load_slot(self, slot):
+        """Reads a variable from the current stack frame, falling back to global memory."""
+        if self.call_stack:
+            value = self.call_stack[-1].locals[slot]
+            if value is not _UNSET:
+                # Pass-by-reference parameters hold their pointer tuple here
+                return value
+        value = self.global_memory[slot]
         # If not found, it's either an error or an uninitialized variable.
         # For simplicity, we return None, but a production compiler would likely error here.
-        # This allows us to handle `ADDR_OF` for uninitialized variables too.
+        return None if value is _UNSET else value
 
-        return None
+    def _store_slot(self, slot, value):
+        """Writes a variable in the current stack frame, or in global memory if there is no call stack."""
+        if self.call_stack:
+            self.call_stack[-1].locals[slot] = value
+            self._locals_dirty = True
+        else:
+            self.global_memory[slot] = value
+            self._globals_dirty = True
+
+    def _get_operand_value(self, operand_name):
+        """Retrieves the value of an operand from current scope or global memory."""
+        if not isinstance(operand_name, str):
+            return operand_name  # It's a literal value
+        slot = self.slot_of.get(operand_name)
+        if slot is None:
+            return None  # Not a variable of this program
+        return self._load_slot(slot)
 
     def _set_variable_value(self, var_name, value):
         """Sets the value of a variable in the current scope or global memory.
            Prioritizes local scope, then global."""
-        if self.call_stack:
-            frame = self.call_stack[-1]
-            # Check if it's a local or a parameter being assigned to.
-            if var_name in frame.locals or var_name.startswith('ARG'):
-                frame.locals[var_name] = value
-                return
-            # If not in locals/params, it's a new local variable for the current frame
-            frame.locals[var_name] = value
-            return
-
-        # If no call stack, it's a global variable
-        self.global_memory[var_name] = value
+        self._store_slot(self._slot_for(var_name), value)
 
     def _get_value_from_pointer(self, pointer):
-        """Gets a value given a pointer tuple like ('heap', 123) or ('global', 'x')."""
-        if not isinstance(pointer, tuple) or len(pointer) != 2:
+        """Gets a value given a pointer tuple like ('heap', 123) or ('global', 'x'), or a raw heap address."""
+        # Exact type checks: a bool is not an address, and pointers are always plain tuples
+        if type(pointer) is int:
+            ptr_type, location = 'heap', pointer  # e.g. an address returned by ALLOC_HEAP
+        elif type(pointer) is tuple and len(pointer) == 2:
+            ptr_type, location = pointer
+        else:
             raise ValueError(f"Invalid pointer format: {pointer}")
 
-        ptr_type, location = pointer
         if ptr_type == 'heap':
-            if not (isinstance(location, int) and 0 <= location < len(self.heap)):
-                raise ValueError(f"Invalid heap address in pointer: {pointer}")
+            if not (type(location) is int and 0 <= location < len(self.heap)):
+                raise ValueError(f"Invalid heap address in pointer: {(ptr_type, location)}")
             return self.heap[location]
         elif ptr_type == 'global':
-            return self.global_memory.get(location)
+            return self.get_global(location)
         elif ptr_type == 'local':
             if not self.call_stack:
                 raise RuntimeError("Attempted to access local pointer with no active stack frame.")
-            return self.call_stack[-1].locals.get(location)
+            return self.get_local(location)
         else:
             raise TypeError(f"Unknown pointer type '{ptr_type}'")
 
     def _set_value_at_pointer(self, pointer, value):
-        """Sets a value given a pointer tuple."""
-        if not isinstance(pointer, tuple) or len(pointer) != 2:
+        """Sets a value given a pointer tuple or a raw heap address."""
+        if type(pointer) is int:
+            ptr_type, location = 'heap', pointer  # e.g. an address returned by ALLOC_HEAP
+        elif type(pointer) is tuple and len(pointer) == 2:
+            ptr_type, location = pointer
+        else:
             raise ValueError(f"Invalid pointer format for storing: {pointer}")
 
-        ptr_type, location = pointer
         if ptr_type == 'heap':
-            if not (isinstance(location, int) and 0 <= location < len(self.heap)):
-                raise ValueError(f"Invalid heap address in pointer: {pointer}")
+            if not (type(location) is int and 0 <= location < len(self.heap)):
+                raise ValueError(f"Invalid heap address in pointer: {(ptr_type, location)}")
             self.heap[location] = value
+            self._heap_dirty = True
         elif ptr_type == 'global':
-            self.global_memory[location] = value
+            self.global_memory[self._slot_for(location)] = value
+            self._globals_dirty = True
         elif ptr_type == 'local':
             if not self.call_stack:
                 raise RuntimeError("Attempted to set local pointer value with no active stack frame.")
-            self.call_stack[-1].locals[location] = value
+            self.call_stack[-1].locals[self._slot_for(location)] = value
+            self._locals_dirty = True
         else:
             raise TypeError(f"Unknown pointer type '{ptr_type}'")
 
@@ -227,252 +696,408 @@ class VM:
         Returns a 'pointer' tuple that describes the location of a variable.
         e.g., ('global', 'x'), ('local', 'y'), or ('heap', 123)
         """
-        # Check if it's a local/param variable first
-        if self.call_stack:
-            frame = self.call_stack[-1]
-            if var_name in frame.locals or var_name in frame.params:
-                return ('local', var_name)
-        # Check if it's a global variable
-        if var_name in self.global_memory:
-            return ('global', var_name)
-        # If the variable doesn't exist, assume it will be a global one.
+        # Check if it's a local/param variable first (parameters are copied into locals)
+        if self.call_stack and self.call_stack[-1].locals[self._slot_for(var_name)] is not _UNSET:
+            return ('local', var_name)
+        # Otherwise it's a global variable, or it doesn't exist yet and will be a global one.
         return ('global', var_name)
 
-    def _allocate_heap_slot(self):
-        """Finds and returns a free heap address (index). Grows heap if needed."""
-        if self.free_heap_slots:
-            addr = self.free_heap_slots.pop(0)
+    def _allocate_heap_block(self, size):
+        """
+        Returns the address of `size` contiguous free heap slots. Grows heap if needed.
+        Single slots reuse the most recently freed address; larger blocks are taken from heap_top,
+        so INDEX_LOAD/INDEX_STORE can address every element from the base address.
+        """
+        self._heap_dirty = True
+        if size == 1 and self.free_heap_slots:
+            addr = self.free_heap_slots.pop()
+            self.heap[addr] = None
+            self.heap_alive[addr] = 1
             return addr
 
-        # If no free slots, extend the heap dynamically
-        current_heap_size = len(self.heap)
-        self.heap.extend([None] * 50)  # Extend by 50 slots
-        new_slots = list(range(current_heap_size, len(self.heap)))
-        self.free_heap_slots.extend(new_slots)
-
-        addr = self.free_heap_slots.pop(0)
+        addr = self.heap_top
+        self.heap_top += size
+        if self.heap_top > len(self.heap):
+            # Not enough room left, so at least double the heap to keep repeated growth amortized O(1)
+            grow_by = max(50, len(self.heap), self.heap_top - len(self.heap))
+            self.heap.extend([None] * grow_by)
+            self.heap_alive.extend(bytes(grow_by))
+        self.heap_alive[addr:self.heap_top] = b'\x01' * size
         return addr
 
     def _free_heap_slot(self, addr):
         """Marks a heap address as free. (Simple approach, not full GC)"""
         if isinstance(addr, int) and 0 <= addr < len(self.heap):
+            self._heap_dirty = True
             if self.heap[addr] is not None:  # Only clear if it held a value
                 self.heap[addr] = None  # Clear value
-            if addr not in self.free_heap_slots:  # Avoid duplicates if already free
+            if self.heap_alive[addr]:  # Avoid duplicates if already free
+                self.heap_alive[addr] = 0
                 self.free_heap_slots.append(addr)
         else:
             self._log_console(f"Warning: Attempted to free invalid or out-of-bounds heap address {addr}\n")
 
-    def _handle_assignment(self, instr):
-        opcode, operands = instr.opcode, instr.operands
-        if opcode == 'ASSIGN':
-            target, source = operands
-            value = self._get_operand_value(source)
-            self._set_variable_value(target, value)
-        elif opcode == 'CONST_ASSIGN':
-            target, value = operands
-            self._set_variable_value(target, value)
-        self.pc += 1
-
-    def _handle_arithmetic(self, instr):
-        opcode, operands = instr.opcode, instr.operands
-        target, op1_name, op2_name = operands
-        val1 = self._get_operand_value(op1_name)
-        val2 = self._get_operand_value(op2_name)
-
-        result = None
-        if opcode == 'ADD': result = val1 + val2
-        elif opcode == 'SUB': result = val1 - val2
-        elif opcode == 'MUL': result = val1 * val2
-        elif opcode == 'DIV':
-            if val2 == 0: raise ZeroDivisionError("Division by zero")
-            result = val1 / val2
-        elif opcode == 'MOD':
-            if val2 == 0: raise ZeroDivisionError("Modulo by zero")
-            result = val1 % val2
-        elif opcode == 'EQ': result = (val1 == val2)
-        elif opcode == 'NE': result = (val1 != val2)
-        elif opcode == 'LT': result = (val1 < val2)
-        elif opcode == 'LE': result = (val1 <= val2)
-        elif opcode == 'GT': result = (val1 > val2)
-        elif opcode == 'GE': result = (val1 >= val2)
-        elif opcode == 'OR': result = (val1 or val2)
-        elif opcode == 'AND': result = (val1 and val2)
-        
-        self._set_variable_value(target, result)
-        self.pc += 1
-
-    def _handle_string(self, instr):
-        opcode, operands = instr.opcode, instr.operands
-        if opcode == 'CONCAT':
-            target, str1_op, str2_op = operands
-            val1 = self._get_operand_value(str1_op)
-            val2 = self._get_operand_value(str2_op)
-            result = str(val1) + str(val2)
-            self._set_variable_value(target, result)
-        elif opcode == 'STRLEN':
-            target, str_op = operands
-            val = self._get_operand_value(str_op)
-            if not isinstance(val, str):
-                raise TypeError(f"STRLEN expects a string, but got {type(val).__name__} from '{str_op}'")
-            self._set_variable_value(target, len(val))
-        elif opcode == 'GETCHAR':
-            target, str_op, index_op = operands
-            string_val = self._get_operand_value(str_op)
-            index_val = self._get_operand_value(index_op)
-            if not isinstance(string_val, str):
-                raise TypeError(f"GETCHAR expects a string, but got {type(string_val).__name__} from '{str_op}'")
-            if not isinstance(index_val, int):
-                raise TypeError(f"GETCHAR expects an integer index, but got {type(index_val).__name__} from '{index_op}'")
-            self._set_variable_value(target, string_val[index_val])
-        self.pc += 1
-
-    def _handle_jump(self, instr):
-        opcode, operands = instr.opcode, instr.operands
-        if opcode == 'JUMP':
-            self.pc = operands[0]
-        elif opcode == 'JUMPT':
-            label_target_pc, condition_var = operands
-            if self._get_operand_value(condition_var):
-                self.pc = label_target_pc
-            else:
-                self.pc += 1
-        elif opcode == 'JUMPF':
-            label_target_pc, condition_var = operands
-            if not self._get_operand_value(condition_var):
-                self.pc = label_target_pc
-            else:
-                self.pc += 1
-
-    def _handle_function(self, instr):
-        opcode, operands = instr.opcode, instr.operands
-        if opcode == 'PARAM':
-            value_to_pass = self._get_operand_value(operands[0])
-            self.current_params.append(value_to_pass)
-            self.pc += 1
-        elif opcode == 'REF_PARAM':
-            var_name = operands[0]
-            addr = self._get_variable_address(var_name)
-            self.current_params.append(addr) # Pass the pointer tuple directly
-            self.pc += 1
-        elif opcode == 'CALL':
-            func_name_label, num_params_expected, return_var_name = operands
-            num_params_expected = int(num_params_expected)
-
-            if len(self.current_params) != num_params_expected:
-                raise ValueError(
-                    f"Function '{func_name_label}' expected {num_params_expected} parameters, but received {len(self.current_params)}")
-
-            new_frame = StackFrame(func_name_label, self.pc + 1, return_var_name)
-            
-            # Parameters are copied into the new frame's 'locals' dictionary.
-            # Pass-by-value copies the value.
-            # Pass-by-reference copies the pointer tuple.
-            for i, param_val in enumerate(self.current_params):
-                arg_name = f'ARG{i}'
-                new_frame.params[arg_name] = param_val # Keep original params for inspection
-                new_frame.locals[arg_name] = param_val # Work with locals
-
-            self.call_stack.append(new_frame)
-            self.current_params = []
-            self.pc = self.labels[func_name_label]
-        elif opcode == 'RETURN':
-            return_value = self._get_operand_value(operands[0]) if operands else None
-            if not self.call_stack:
-                raise RuntimeError("RETURN instruction outside of a function call. Halting.")
-
-            old_frame = self.call_stack.pop()
-            self.pc = old_frame.return_address
-
-            if old_frame.return_var_name:
-                self._set_variable_value(old_frame.return_var_name, return_value)
-
-    def _handle_heap(self, instr):
-        opcode, operands = instr.opcode, instr.operands
-        if opcode == 'ALLOC_HEAP':
-            target_ptr_var, size_var_or_literal = operands
-            size_val = self._get_operand_value(size_var_or_literal)
-            if not isinstance(size_val, int) or size_val <= 0:
-                raise ValueError(f"ALLOC_HEAP size must be a positive integer, got '{size_val}'")
-
-            allocated_addresses = [self._allocate_heap_slot() for _ in range(size_val)]
-            for addr in allocated_addresses: self.heap[addr] = None
-
-            if not allocated_addresses: raise MemoryError(f"Failed to allocate heap memory for size {size_val}")
-            self._set_variable_value(target_ptr_var, allocated_addresses[0])
-        
-        elif opcode == 'FREE_HEAP':
-            ptr_var = operands[0]
-            ptr_addr = self._get_operand_value(ptr_var)
-            if not isinstance(ptr_addr, int) or not (0 <= ptr_addr < len(self.heap)):
-                self._log_console(f"Warning: FREE_HEAP called with invalid address: {ptr_addr}\n")
-            else:
-                self._free_heap_slot(ptr_addr)
-                self._log_console(f"Note: Simplified FREE_HEAP for address {ptr_addr} called.\n")
-
-        elif opcode == 'ADDR_OF':
-            target_ptr_var, source_var = operands
-            # Get the pointer/address of the source variable and store it in the target.
-            pointer = self._get_variable_address(source_var)
-            self._set_variable_value(target_ptr_var, pointer)
-
-        elif opcode == 'DEREF_LOAD':
-            target_var, ptr_var = operands
-            pointer = self._get_operand_value(ptr_var)
-            value = self._get_value_from_pointer(pointer)
-            self._set_variable_value(target_var, value)
-
-        elif opcode == 'DEREF_STORE':
-            ptr_var, value_source = operands
-            pointer = self._get_operand_value(ptr_var)
-            value_to_store = self._get_operand_value(value_source)
-            self._set_value_at_pointer(pointer, value_to_store)
-
-        elif opcode == 'INDEX_LOAD':
-            target_var, base_ptr_var, index_var = operands
-            base_addr = self._get_operand_value(base_ptr_var)
-            index_val = self._get_operand_value(index_var)
-            if not isinstance(base_addr, int) or not (0 <= base_addr < len(self.heap)):
-                raise ValueError(f"INDEX_LOAD error: Invalid base address '{base_addr}' in '{base_ptr_var}'")
-            if not isinstance(index_val, int):
-                raise ValueError(f"INDEX_LOAD error: Index must be an integer, got '{index_val}'")
-            effective_addr = base_addr + index_val
-            if not (0 <= effective_addr < len(self.heap)):
-                raise IndexError(f"INDEX_LOAD error: Address {effective_addr} is out of bounds.")
-            self._set_variable_value(target_var, self.heap[effective_addr])
-
-        elif opcode == 'INDEX_STORE':
-            base_ptr_var, index_var, value_source = operands
-            base_addr = self._get_operand_value(base_ptr_var)
-            index_val = self._get_operand_value(index_var)
-            value_to_store = self._get_operand_value(value_source)
-            if not isinstance(base_addr, int) or not (0 <= base_addr < len(self.heap)):
-                raise ValueError(f"INDEX_STORE error: Invalid base address '{base_addr}' in '{base_ptr_var}'")
-            if not isinstance(index_val, int):
-                raise ValueError(f"INDEX_STORE error: Index must be an integer, got '{index_val}'")
-            effective_addr = base_addr + index_val
-            if not (0 <= effective_addr < len(self.heap)):
-                raise IndexError(f"INDEX_STORE error: Address {effective_addr} is out of bounds.")
-            self.heap[effective_addr] = value_to_store
-        
-        self.pc += 1
-
-    def _handle_misc(self, instr):
-        opcode, operands = instr.opcode, instr.operands
-        if opcode == 'PRINT':
-            value = self._get_operand_value(operands[0])
-            self._log_console(f"Output: {value}\n")
-            self.pc += 1
-        elif opcode == 'HALT':
-            self.halted = True
-            self.running = False
-            self.pc += 1
-            self._log_console("--- Program Halted ---\n")
-        elif opcode == 'UMINUS':
-            target, source = operands
-            val = self._get_operand_value(source)
-            self._set_variable_value(target, -val)
-            self.pc += 1
+    # --- Assignment ---
+
+    def _op_assign(self, instr):
+        self._store_slot(instr.args[0], self._operand_value(instr, 1))
+
+    def _op_const_assign(self, instr):
+        self._store_slot(instr.args[0], instr.operands[1])
+
+    # --- Arithmetic, comparison and logic ---
+
+    def _binary_operands(self, instr):
+        """Returns (target slot, value1, value2) for a three-operand instruction."""
+        return instr.args[0], self._operand_value(instr, 1), self._operand_value(instr, 2)
+
+    def _op_add(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 + val2)
+
+    def _op_sub(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 - val2)
+
+    def _op_mul(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 * val2)
+
+    def _op_div(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        if val2 == 0: raise ZeroDivisionError("Division by zero")
+        self._store_slot(target, val1 / val2)
+
+    def _op_mod(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        if val2 == 0: raise ZeroDivisionError("Modulo by zero")
+        self._store_slot(target, val1 % val2)
+
+    def _op_eq(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 == val2)
+
+    def _op_ne(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 != val2)
+
+    def _op_lt(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 < val2)
+
+    def _op_le(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 <= val2)
+
+    def _op_gt(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 > val2)
+
+    def _op_ge(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 >= val2)
+
+    def _op_or(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 or val2)
+
+    def _op_and(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, val1 and val2)
+
+    def _op_uminus(self, instr):
+        self._store_slot(instr.args[0], -self._operand_value(instr, 1))
+
+    # --- Strings ---
+
+    def _op_concat(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        self._store_slot(target, str(val1) + str(val2))
+
+    def _op_strlen(self, instr):
+        str_op = instr.operands[1]
+        val = self._operand_value(instr, 1)
+        if not isinstance(val, str):
+            raise TypeError(f"STRLEN expects a string, but got {type(val).__name__} from '{str_op}'")
+        self._store_slot(instr.args[0], len(val))
+
+    def _op_getchar(self, instr):
+        str_op, index_op = instr.operands[1:]
+        string_val = self._operand_value(instr, 1)
+        index_val = self._operand_value(instr, 2)
+        if not isinstance(string_val, str):
+            raise TypeError(f"GETCHAR expects a string, but got {type(string_val).__name__} from '{str_op}'")
+        if not isinstance(index_val, int):
+            raise TypeError(f"GETCHAR expects an integer index, but got {type(index_val).__name__} from '{index_op}'")
+        self._store_slot(instr.args[0], string_val[index_val])
+
+    # --- Control flow ---
+
+    def _op_jump(self, instr):
+        return instr.operands[0]
+
+    def _op_jumpt(self, instr):
+        if self._operand_value(instr, 1):
+            return instr.operands[0]
+
+    def _op_jumpf(self, instr):
+        if not self._operand_value(instr, 1):
+            return instr.operands[0]
+
+    def _op_fall_through(self, instr):
+        """Fast handler for a JUMPT/JUMPF whose literal condition never jumps."""
+
+    # --- Superinstructions (see _fuse_instructions) ---
+
+    def _op_compare_branch(self, instr):
+        target, val1, val2 = self._binary_operands(instr)
+        result = _COMPARISONS[instr.op](val1, val2)
+        self._store_slot(target, result)
+        jump_if, target_pc, fallthrough_pc = instr.args[3:]
+        return target_pc if bool(result) == jump_if else fallthrough_pc
+
+    def _op_assign_branch(self, instr):
+        value = self._operand_value(instr, 1)
+        self._store_slot(instr.args[0], value)
+        jump_if, target_pc, fallthrough_pc = instr.args[2:]
+        return target_pc if bool(value) == jump_if else fallthrough_pc
+
+    def _op_vector_loop(self, plan, instr):
+        """
+        Runs every remaining iteration of a loop found by _match_vector_loop with one map() over
+        heap slices. Falls back to the header's compare-and-branch, and so to normal interpretation,
+        whenever the bulk result could differ: bad bounds, overlapping arrays or a failing operation.
+        After a failing operation the rest of that run of the loop is interpreted without retrying.
+        """
+        c, i, n, n_is_var, a, b, r, x, y, z, op, exit_pc = plan
+        load = self._load_slot
+        start = load(i)
+        scope = self.call_stack[-1].locals if self.call_stack else self.global_memory
+        failed = self._failed_vector_loops.get(exit_pc)
+        if failed is not None:
+            # The same run has moved past where it failed; a rerun starts at or before that index
+            if failed[0] is scope and type(start) is int and start > failed[1]:
+                return self._op_compare_branch(instr)
+            del self._failed_vector_loops[exit_pc]
+        stop = load(n) if n_is_var else n
+        bases = (load(a), load(b), load(r))
+        heap = self.heap
+        size = len(heap)
+        if not (type(start) is int and type(stop) is int and start < stop
+                and all(type(base) is int and 0 <= base < size and 0 <= base + start and base + stop <= size
+                        for base in bases)):
+            return self._op_compare_branch(instr)
+        a_base, b_base, r_base = bases
+        count = stop - start
+        for src in (a_base, b_base):
+            # Writing r[i] may change a later a[j] or b[j] unless the arrays are the same or disjoint
+            if src != r_base and abs(src - r_base) < count:
+                return self._op_compare_branch(instr)
+
+        lhs = heap[a_base + start:a_base + stop]
+        rhs = heap[b_base + start:b_base + stop]
+        try:
+            results = list(map(op, lhs, rhs))
+        except Exception:
+            self._failed_vector_loops[exit_pc] = (scope, start)
+            return self._op_compare_branch(instr)  # Let the interpreter raise it at the right element
+        heap[r_base + start:r_base + stop] = results
+        self._heap_dirty = True
+
+        # Leave the scalars as the last iteration and the failed loop test would have
+        store = self._store_slot
+        store(x, lhs[-1])
+        store(y, rhs[-1])
+        store(z, results[-1])
+        store(i, stop)
+        store(c, False)
+        return exit_pc
+
+    # --- Functions ---
+
+    def _compile_function(self, function, num_params):
+        """
+        Translates a function body into a Python function of its parameters, if the body is a
+        straight run of arithmetic, comparison and assignment instructions over its parameters and
+        its own earlier results, ending in RETURN. Such a call has no effects other than its result,
+        so it can skip the frame and the instruction dispatch. Returns None for any other function.
+        """
+        defined = set(range(num_params))  # Slots that hold a value at this point; ARG<i> has slot i
+
+        def atom(instr, index):
+            if instr.kinds[index] < KIND_VAR:
+                return repr(instr.args[index])  # A literal
+            if instr.args[index] in defined:
+                return f"v{instr.args[index]}"
+            return None  # Would read a global or an unset local
+
+        lines = [f"def function({', '.join(f'v{i}' for i in range(num_params))}):"]
+        for instr in self.program[function.entry_pc:]:
+            if instr.op == Op.RETURN:
+                result = atom(instr, 0) if instr.operands else 'None'
+                if result is None:
+                    return None
+                lines.append(f"    return {result}")
+                break
+            expression = _INLINE_EXPRESSIONS.get(instr.op)
+            if expression is None or len(instr.kinds) != expression.count('{') + 1 or instr.kinds[0] < KIND_VAR:
+                return None
+            operands = [atom(instr, index) for index in range(1, len(instr.kinds))]
+            if None in operands:
+                return None
+            lines.append(f"    v{instr.args[0]} = {expression.format(None, *operands)}")
+            defined.add(instr.args[0])
+        else:
+            return None  # Runs off the end of the program
+
+        namespace = {}
+        exec(compile("\n".join(lines), f"<3AC function {function.name}>", 'exec'), namespace)
+        return namespace['function']
+
+    def _op_call_compiled(self, instr):
+        """CALL used by run_until_halt: runs the callee as a compiled function when _compile_function allows it."""
+        function, num_params = instr.args[:2]
+        if num_params in function.compiled:
+            compiled = function.compiled[num_params]
+        else:
+            compiled = function.compiled[num_params] = self._compile_function(function, num_params)
+        if compiled is None or len(self.current_params) != num_params:
+            return self._op_call(instr)
+        try:
+            result = compiled(*self.current_params)
+        except Exception:
+            return self._op_call(instr)  # Interpret the call so the error is reported at its instruction
+        self.current_params = []
+        self._store_slot(instr.args[2], result)
+        return instr.return_address
+
+    def _op_param(self, instr):
+        self.current_params.append(self._operand_value(instr, 0))
+
+    def _op_ref_param(self, instr):
+        addr = self._get_variable_address(instr.operands[0])
+        self.current_params.append(addr) # Pass the pointer tuple directly
+
+    def _op_call(self, instr):
+        function, num_params_expected = instr.args[:2]
+
+        if len(self.current_params) != num_params_expected:
+            raise ValueError(
+                f"Function '{function.name}' expected {num_params_expected} parameters, but received {len(self.current_params)}")
+
+        new_frame = self._acquire_frame(function.name, instr.return_address, instr.operands[2])
+
+        # Parameters are copied into the first slots of the new frame's locals (ARG<i> has slot i).
+        # Pass-by-value copies the value.
+        # Pass-by-reference copies the pointer tuple.
+        new_frame.params = self.current_params  # Keep original params for inspection
+        new_frame.locals = [_UNSET] * len(self.slot_names)
+        new_frame.locals[:num_params_expected] = self.current_params
+
+        self.call_stack.append(new_frame)
+        self._stack_dirty = True
+        self.current_params = []
+        return function.entry_pc
+
+    def _op_return(self, instr):
+        return_value = self._operand_value(instr, 0) if instr.operands else None
+        if not self.call_stack:
+            raise RuntimeError("RETURN instruction outside of a function call. Halting.")
+
+        old_frame = self.call_stack.pop()
+        self._stack_dirty = True
+
+        if old_frame.return_var_name:
+            self._set_variable_value(old_frame.return_var_name, return_value)
+        return_address = old_frame.return_address
+        self._release_frame(old_frame)
+        return return_address
+
+    def _acquire_frame(self, func_name, return_address, return_var_name):
+        """Returns a StackFrame for a new call, reusing one released by an earlier RETURN if there is one."""
+        if not self._frame_pool:
+            return StackFrame(func_name, return_address, return_var_name)
+        frame = self._frame_pool.pop()
+        frame.func_name = func_name
+        frame.return_address = return_address
+        frame.return_var_name = return_var_name
+        return frame
+
+    def _release_frame(self, frame):
+        """Puts a returned-from frame back in the pool, dropping its variables."""
+        frame.locals = frame.params = None
+        self._frame_pool.append(frame)
+
+    # --- Heap and pointers ---
+
+    def _op_alloc_heap(self, instr):
+        size_val = self._operand_value(instr, 1)
+        if not isinstance(size_val, int) or size_val <= 0:
+            raise ValueError(f"ALLOC_HEAP size must be a positive integer, got '{size_val}'")
+
+        self._store_slot(instr.args[0], self._allocate_heap_block(size_val))
+
+    def _op_free_heap(self, instr):
+        ptr_addr = self._operand_value(instr, 0)
+        if not isinstance(ptr_addr, int) or not (0 <= ptr_addr < len(self.heap)):
+            self._log_console(f"Warning: FREE_HEAP called with invalid address: {ptr_addr}\n")
+        else:
+            self._free_heap_slot(ptr_addr)
+            self._log_console(f"Note: Simplified FREE_HEAP for address {ptr_addr} called.\n")
+
+    def _op_addr_of(self, instr):
+        source_var = instr.operands[1]
+        # Get the pointer/address of the source variable and store it in the target.
+        pointer = self._get_variable_address(source_var)
+        self._store_slot(instr.args[0], pointer)
+
+    def _op_deref_load(self, instr):
+        pointer = self._operand_value(instr, 1)
+        self._store_slot(instr.args[0], self._get_value_from_pointer(pointer))
+
+    def _op_deref_store(self, instr):
+        pointer = self._operand_value(instr, 0)
+        self._set_value_at_pointer(pointer, self._operand_value(instr, 1))
+
+    def _op_index_load(self, instr):
+        base_ptr_var = instr.operands[1]
+        base_addr = self._operand_value(instr, 1)
+        index_val = self._operand_value(instr, 2)
+        if not isinstance(base_addr, int) or not (0 <= base_addr < len(self.heap)):
+            raise ValueError(f"INDEX_LOAD error: Invalid base address '{base_addr}' in '{base_ptr_var}'")
+        if not isinstance(index_val, int):
+            raise ValueError(f"INDEX_LOAD error: Index must be an integer, got '{index_val}'")
+        effective_addr = base_addr + index_val
+        if not (0 <= effective_addr < len(self.heap)):
+            raise IndexError(f"INDEX_LOAD error: Address {effective_addr} is out of bounds.")
+        self._store_slot(instr.args[0], self.heap[effective_addr])
+
+    def _op_index_store(self, instr):
+        base_ptr_var = instr.operands[0]
+        base_addr = self._operand_value(instr, 0)
+        index_val = self._operand_value(instr, 1)
+        value_to_store = self._operand_value(instr, 2)
+        if not isinstance(base_addr, int) or not (0 <= base_addr < len(self.heap)):
+            raise ValueError(f"INDEX_STORE error: Invalid base address '{base_addr}' in '{base_ptr_var}'")
+        if not isinstance(index_val, int):
+            raise ValueError(f"INDEX_STORE error: Index must be an integer, got '{index_val}'")
+        effective_addr = base_addr + index_val
+        if not (0 <= effective_addr < len(self.heap)):
+            raise IndexError(f"INDEX_STORE error: Address {effective_addr} is out of bounds.")
+        self.heap[effective_addr] = value_to_store
+        self._heap_dirty = True
+
+    # --- Miscellaneous ---
+
+    def _op_print(self, instr):
+        value = self._operand_value(instr, 0)
+        self._log_console(f"Output: {value}\n")
+
+    def _op_halt(self, instr):
+        self.halted = True
+        self.running = False
+        self._log_console("--- Program Halted ---\n")
+        raise _Halt
 
     def step(self):
         """Executes one 3AC instruction."""
@@ -480,25 +1105,114 @@ class VM:
             self.running = False
             return False  # Program finished or halted
 
-        instr = self.program[self.pc]
-        opcode = instr.opcode
+        pc = self.pc
+        instr = self.program[pc]
 
         try:
-            handler = self.opcode_handlers.get(opcode)
-            if handler:
-                handler(instr)
-            else:
-                raise NotImplementedError(f"Unknown or unsupported opcode: {opcode}")
+            self.pc = pc + 1
+            target = instr.handler(instr)
+            if target is not None:
+                self.pc = target
+            return True  # Indicate successful step
 
-            # The HALT handler sets running to False, so this check works for halting.
-            if not self.running:
-                return False
+        except _Halt:
+            return False
 
-            return True  # Indicate successful step
+        except Exception as e:
+            self._runtime_error(instr, pc, e)
+            return False  # Indicate program halted due to error
+
+        finally:
+            self._flush_console()
+
+    def _runtime_error(self, instr, pc, error):
+        """Stops the program after an instruction failed and reports the error."""
+        self.running = False
+        self.pc = pc  # Leave the PC on the instruction that failed
+        error_msg = f"Runtime Error at 3AC line {instr.line_num} (PC={pc}): {error}\n"
+        self._log_console(f"!!! {error_msg}")
+        self._flush_console()
+        messagebox.showerror("Runtime Error", error_msg)
 
+    def run_until(self, bp_mask=None, max_steps=None):
+        """
+        Executes instructions until the program stops or reaches a breakpoint.
+        bp_mask is a bytearray indexed by PC that is non-zero for instructions on breakpoint lines.
+        If max_steps is given, returns after that many instructions even if the program is still running.
+        Returns True if execution paused at a breakpoint, False otherwise.
+        """
+        if bp_mask is None:
+            self.run_until_halt(max_steps)
+            return False
+        if self.halted:
+            self.running = False
+        if not self.running:
+            return False
+        program = self.program
+        end = len(program)
+        pc = self.pc
+        try:
+            for _ in itertools.repeat(None, sys.maxsize if max_steps is None else max_steps):
+                if pc >= end:
+                    break
+                # Check for breakpoint BEFORE executing the instruction
+                if bp_mask[pc]:
+                    self.pc = pc
+                    return True
+                instr = program[pc]
+                pc += 1
+                target = instr.handler(instr)
+                if target is not None:
+                    pc = target
+            else:
+                self.pc = pc
+                return False  # Out of steps, still running
+        except _Halt:
+            pass
         except Exception as e:
+            self._runtime_error(instr, pc - 1, e)
+            return False
+        finally:
+            self._flush_console()
+        self.pc = pc
+        self.running = False
+        return False
+
+    def run_until_halt(self, max_steps=None):
+        """
+        Executes instructions until the program halts, runs off the end or fails, ignoring breakpoints.
+        If max_steps is given, returns after that many dispatches even if the program is still running.
+        A basic block (see _form_blocks) runs as a single dispatch.
+        The PC is kept in a local variable and only written back to self.pc when the loop exits.
+        """
+        if self.halted:
             self.running = False
-            error_msg = f"Runtime Error at 3AC line {instr.line_num} (PC={self.pc}): {e}\n"
-            self._log_console(f"!!! {error_msg}")
-            messagebox.showerror("Runtime Error", error_msg)
-            return False  # Indicate program halted due to error
\ No newline at end of file
+        if not self.running:
+            return
+        program = self.program
+        end = len(program)
+        pc = self.pc
+        try:
+            for _ in itertools.repeat(None, sys.maxsize if max_steps is None else max_steps):
+                if pc >= end:
+                    break
+                instr = program[pc]
+                pc += 1
+                target = instr.fast_handler(instr)
+                if target is not None:
+                    pc = target
+            else:
+                self.pc = pc
+                return  # Out of steps, still running
+        except _Halt:
+            pass
+        except _InstructionFailed as failure:
+            self._runtime_error(program[failure.pc], failure.pc, failure.error)
+            return
+        except Exception as e:
+            self._runtime_error(instr, pc - 1, e)
+            return
+        finally:
+            self._flush_console()
+        self.pc = pc
+        self.running = False